@@ -0,0 +1,70 @@
+import pandas as pd
+from heatmap import HEAT_CELL_PIXELS, HEAT_GRID_ZOOMS, cell_points, grid_cells
+
+# Grid cells are packed into one integer key so per-chunk bins can be added as Series
+CELL_KEY_SHIFT = 32
+
+def _tally(total, counts):
+    """Add a chunk's value counts into a running total"""
+    return counts.astype('int64') if total is None else total.add(counts, fill_value=0).astype('int64')
+
+class StreamingAggregates:
+    """Running counts over chunks of incidents, so memory stays bounded by the number of keys
+
+    Tallies incidents per day of week, hour, month and location type and, per
+    year and zoom, per heatmap grid cell.
+    """
+
+    def __init__(self, heat_zooms=HEAT_GRID_ZOOMS, cell_pixels=HEAT_CELL_PIXELS):
+        self.heat_zooms = heat_zooms
+        self.cell_pixels = cell_pixels
+        self.rows = 0
+        self.counts = {}
+        self.heat_cells = {}
+
+    def _count(self, name, values):
+        self.counts[name] = _tally(self.counts.get(name), values.value_counts())
+
+    def update(self, chunk):
+        """Fold one chunk of rows into the running counts"""
+        self.rows += len(chunk)
+        for name, column in [('dow', 'dow'), ('hour', 'hour'), ('month', 'month'),
+                             ('location', 'Location Description')]:
+            if column in chunk:
+                self._count(name, chunk[column].astype('object'))
+
+        if 'Latitude' not in chunk or not self.heat_zooms:
+            return
+        for year, year_chunk in chunk.groupby('Year', sort=False):
+            for zoom in self.heat_zooms:
+                cell_x, cell_y, counts = grid_cells(year_chunk, zoom, self.cell_pixels)
+                cells = pd.Series(counts, index=(cell_x << CELL_KEY_SHIFT) | cell_y)
+                key = (int(year), zoom)
+                self.heat_cells[key] = _tally(self.heat_cells.get(key), cells)
+
+    def count(self, name):
+        """Return the running counts for dow, hour, month or location"""
+        return self.counts.get(name, pd.Series(dtype='int64'))
+
+    def years(self):
+        """Return the years seen so far, in order"""
+        return sorted({year for year, _ in self.heat_cells})
+
+    def heat_levels(self, year=None):
+        """Return weighted heatmap cells {zoom: [[lat, lon, count], ...]} for one year or all years"""
+        levels = {}
+        for zoom in self.heat_zooms:
+            cells = [
+                series for (cell_year, cell_zoom), series in self.heat_cells.items()
+                if cell_zoom == zoom and (year is None or cell_year == year)
+            ]
+            if not cells:
+                levels[zoom] = []
+                continue
+            merged = pd.concat(cells).groupby(level=0).sum().sort_index()
+            keys = merged.index.to_numpy()
+            levels[zoom] = cell_points(
+                keys >> CELL_KEY_SHIFT, keys & ((1 << CELL_KEY_SHIFT) - 1),
+                merged.to_numpy(), zoom, self.cell_pixels
+            )
+        return levels
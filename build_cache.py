@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+# Bump when the shape of cached fragments changes so stale entries are rebuilt
+CACHE_VERSION = 3
+
+def content_hash(*parts):
+    """Hash DataFrames, bytes and JSON-serializable values into one hex digest"""
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode())
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(json.dumps(list(map(str, part.columns))).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        elif isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+class BuildCache:
+    """Directory of rendered dashboard fragments, each stored with the hash of its inputs"""
+
+    def __init__(self, path='.build_cache'):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, name, key):
+        """Return the fragment stored under name if its key matches, else None"""
+        path = os.path.join(self.path, f'{name}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+        if entry['key'] != key:
+            return None
+        self.hits += 1
+        return entry['value']
+
+    def put(self, name, key, value):
+        """Store a freshly built fragment under name, replacing any older one"""
+        self.misses += 1
+        path = os.path.join(self.path, f'{name}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'value': value}, f)
+        os.replace(path + '.tmp', path)
+
+    def fetch(self, name, key, build):
+        """Return the fragment stored under name if its key matches, else build and store it"""
+        value = self.get(name, key)
+        if value is None:
+            value = build()
+            self.put(name, key, value)
+        return value
+
+def cached(cache, name, parts, build):
+    """Fetch a fragment through cache keyed on the hash of parts, or just build it without a cache"""
+    if cache is None:
+        return build()
+    return cache.fetch(name, content_hash(*parts), build)
@@ -0,0 +1,123 @@
+import json
+import numpy as np
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import HeatMap
+from folium.template import Template
+from tiles import tile_coordinates
+
+# Decimal places kept for coordinates sent to the browser (~0.1 m)
+COORDINATE_DECIMALS = 6
+
+# Zoom levels the heatmap grid is precomputed for; deeper zooms reuse the finest level
+HEAT_GRID_ZOOMS = (10, 11, 12, 13, 14)
+
+# Grid cell size in screen pixels at each level's own zoom, close to Leaflet.heat's
+# internal radius / 2 binning so a precomputed level renders like the raw points
+HEAT_CELL_PIXELS = 8
+
+def heat_points(data, decimals=COORDINATE_DECIMALS, weight=None):
+    """Return HeatMap input as [[lat, lon(, weight)], ...] straight from the coordinate arrays"""
+    points = data[['Latitude', 'Longitude']].to_numpy(dtype='float64')
+    if decimals is not None:
+        points = points.round(decimals)
+    if weight is not None:
+        points = np.column_stack([points, data[weight].to_numpy(dtype='float64')])
+    return points.tolist()
+
+def grid_cells(data, zoom, cell_pixels=HEAT_CELL_PIXELS):
+    """Bin incidents into Web Mercator grid cells at a zoom, returning (cell_x, cell_y, count) arrays"""
+    cells_per_tile = 256 // cell_pixels
+    x, y = tile_coordinates(data['Longitude'], data['Latitude'], zoom)
+    cells = np.column_stack([
+        np.floor(x * cells_per_tile).astype('int64'),
+        np.floor(y * cells_per_tile).astype('int64'),
+    ])
+    if not len(cells):
+        empty = np.empty(0, dtype='int64')
+        return empty, empty, empty
+    unique, counts = np.unique(cells, axis=0, return_counts=True)
+    return unique[:, 0], unique[:, 1], counts
+
+def cell_points(cell_x, cell_y, counts, zoom, cell_pixels=HEAT_CELL_PIXELS, decimals=COORDINATE_DECIMALS):
+    """Turn grid cells into weighted HeatMap input [[lat, lon, count], ...] at the cell centers"""
+    n = 2 ** zoom * (256 // cell_pixels)
+    lon = (np.asarray(cell_x) + 0.5) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(cell_y) + 0.5) / n))))
+    return np.column_stack([
+        lat.round(decimals), lon.round(decimals), np.asarray(counts, dtype='float64')
+    ]).tolist()
+
+def heat_grid_pyramid(data, zooms=HEAT_GRID_ZOOMS, cell_pixels=HEAT_CELL_PIXELS):
+    """Precompute weighted heatmap cells for each zoom level, as {zoom: [[lat, lon, count], ...]}"""
+    return {
+        zoom: cell_points(*grid_cells(data, zoom, cell_pixels), zoom, cell_pixels)
+        for zoom in zooms
+    }
+
+def heat_payload(data, heat_grid=False):
+    """Serialize a frame's heatmap input, raw points or a grid pyramid, to compact JSON"""
+    heat = heat_grid_pyramid(data) if heat_grid else heat_points(data)
+    return json.dumps(heat, separators=(',', ':'))
+
+class JsonHeatMap(HeatMap):
+    """HeatMap whose points are already serialized to JSON, e.g. by heat_payload"""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.heatLayer(
+                {{ this.data_json }},
+                {{ this.options|tojavascript }}
+            );
+        {% endmacro %}
+    """)
+
+    def __init__(self, data_json, **kwargs):
+        super().__init__([], **kwargs)
+        self.data_json = data_json
+
+class GridHeatMap(JSCSSMixin, Layer):
+    """Leaflet.heat layer fed from a serialized grid pyramid, swapping levels on zoom"""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            // The parent may be a FeatureGroup, so the map is taken from the layer once added
+            var levels = {{ this.levels_json }};
+            var zooms = Object.keys(levels).map(Number).sort(function (a, b) { return a - b; });
+            function levelFor(zoom) {
+                var level = zooms[0];
+                zooms.forEach(function (z) {
+                    if (z <= zoom) {
+                        level = z;
+                    }
+                });
+                return levels[level];
+            }
+            var layer = L.heatLayer([], {{ this.options|tojavascript }});
+            function update() {
+                layer.setLatLngs(levelFor(layer._map.getZoom()));
+            }
+            layer.on('add', function () {
+                update();
+                layer._map.on('zoomend', update);
+            });
+            layer.on('remove', function () {
+                layer._map.off('zoomend', update);
+            });
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = HeatMap.default_js
+
+    def __init__(self, levels_json, name=None, radius=15, blur=15, min_opacity=0.5, max_zoom=18,
+                 overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'GridHeatMap'
+        self.levels_json = levels_json
+        self.options = {
+            'minOpacity': min_opacity,
+            'maxZoom': max_zoom,
+            'radius': radius,
+            'blur': blur,
+        }
@@ -1,29 +1,123 @@
+import argparse
 import folium
+import os
 import sqlite3
+import time
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from folium import plugins
 from branca.colormap import LinearColormap
 import json
 import requests
-from shapely.geometry import Point
+import shapely
+import ingest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from aggregates import StreamingAggregates
+from build_cache import BuildCache, cached
+from heatmap import GridHeatMap, JsonHeatMap, heat_payload
+from tiles import VectorTileLayer, build_tile_pyramid
 
-def load_chicago_neighborhoods():
-    """Load Chicago community areas boundary data"""
-    # Download Chicago community areas GeoJSON
-    url = "https://data.cityofchicago.org/api/geospatial/cauq-8yn6?method=export&format=GeoJSON"
+NEIGHBORHOODS_URL = "https://data.cityofchicago.org/api/geospatial/cauq-8yn6?method=export&format=GeoJSON"
+BOUNDARY_CACHE = 'boundaries.db'
+BUNDLED_BOUNDARIES = 'community_areas.geojson'
+
+def _read_cached_boundaries(url, cache_path):
+    """Read cached boundary polygons for a source URL, returning (etag, GeoDataFrame)"""
+    if not os.path.exists(cache_path):
+        return None, None
+    conn = sqlite3.connect(cache_path)
+    try:
+        source = conn.execute(
+            "SELECT etag FROM boundary_sources WHERE url = ?", (url,)
+        ).fetchone()
+        if source is None:
+            return None, None
+        rows = conn.execute(
+            "SELECT properties, geometry FROM boundary_features WHERE url = ? ORDER BY rowid",
+            (url,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None, None
+    finally:
+        conn.close()
+    
+    properties = pd.DataFrame([json.loads(props) for props, _ in rows])
+    geometry = shapely.from_wkb([wkb for _, wkb in rows])
+    neighborhoods = gpd.GeoDataFrame(properties, geometry=geometry, crs="EPSG:4326")
+    return source[0], neighborhoods
+
+def _write_cached_boundaries(url, etag, neighborhoods, cache_path):
+    """Persist boundary polygons as WKB rows keyed by source URL and ETag"""
+    properties = neighborhoods.drop(columns='geometry')
+    rows = [
+        (url, props.to_json(), wkb)
+        for (_, props), wkb in zip(properties.iterrows(), shapely.to_wkb(neighborhoods.geometry.values))
+    ]
+    conn = sqlite3.connect(cache_path)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS boundary_sources (url TEXT PRIMARY KEY, etag TEXT, fetched_at TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS boundary_features (url TEXT, properties TEXT, geometry BLOB)"
+            )
+            conn.execute("DELETE FROM boundary_features WHERE url = ?", (url,))
+            conn.executemany(
+                "INSERT INTO boundary_features (url, properties, geometry) VALUES (?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO boundary_sources (url, etag, fetched_at) VALUES (?, ?, ?)",
+                (url, etag, datetime.now().isoformat(timespec='seconds'))
+            )
+    finally:
+        conn.close()
+
+def load_chicago_neighborhoods(url=NEIGHBORHOODS_URL, cache_path=BOUNDARY_CACHE, refresh=False, offline=False):
+    """Load Chicago community areas boundary data, preferring the local cache"""
+    etag, cached = _read_cached_boundaries(url, cache_path)
+    if cached is None and os.path.exists(BUNDLED_BOUNDARIES):
+        # Seed the cache from the copy shipped alongside the scripts
+        cached = gpd.read_file(BUNDLED_BOUNDARIES).to_crs("EPSG:4326")
+        _write_cached_boundaries(url, None, cached, cache_path)
+    
+    if cached is not None and not refresh:
+        return cached
+    if offline:
+        if cached is None:
+            print("Error loading neighborhood data: no cached boundaries available offline")
+        return cached
+    
+    # Download Chicago community areas GeoJSON, revalidating any cached copy by ETag
     try:
-        response = requests.get(url)
+        headers = {'If-None-Match': etag} if cached is not None and etag else {}
+        response = requests.get(url, headers=headers, timeout=30)
+        if response.status_code == 304:
+            return cached
+        response.raise_for_status()
         neighborhoods = gpd.GeoDataFrame.from_features(response.json()["features"])
         neighborhoods.crs = "EPSG:4326"  # Set coordinate reference system
+        _write_cached_boundaries(url, response.headers.get('ETag'), neighborhoods, cache_path)
         return neighborhoods
     except Exception as e:
+        if cached is not None:
+            print(f"Could not refresh neighborhood data ({e}), using cached copy")
+            return cached
         print(f"Error loading neighborhood data: {e}")
         return None
 
-def load_crime_data():
-    """Load crime data from SQLite database"""
+def to_points(crime_data):
+    """Build point geometries for a frame of Latitude/Longitude in one vectorized call"""
+    geometry = gpd.points_from_xy(crime_data.Longitude, crime_data.Latitude, crs="EPSG:4326")
+    return gpd.GeoDataFrame(crime_data, geometry=geometry)
+
+def load_crime_data(as_geometry=True):
+    """Load crime data from SQLite database
+
+    With as_geometry=False the coordinates stay plain float columns; call
+    to_points() once a geometric operation actually needs shapely objects.
+    """
     try:
         conn = sqlite3.connect('homicides.db')
         query = """
@@ -35,21 +129,127 @@ def load_crime_data():
         conn.close()
         
         # Convert to GeoDataFrame
-        geometry = [Point(xy) for xy in zip(crime_data.Longitude, crime_data.Latitude)]
-        crime_gdf = gpd.GeoDataFrame(crime_data, geometry=geometry, crs="EPSG:4326")
-        return crime_gdf
+        return to_points(crime_data) if as_geometry else crime_data
     except Exception as e:
         print(f"Error loading crime data: {e}")
         return None
 
-def create_chloropleth_map():
-    """Create chloropleth map of crime hotspots"""
-    # Load data
-    print("Loading neighborhood boundaries...")
-    neighborhoods = load_chicago_neighborhoods()
+def iter_crime_chunks(chunksize=100_000, db_path='homicides.db'):
+    """Yield crime coordinates from SQLite chunksize rows at a time, keeping memory bounded"""
+    conn = sqlite3.connect(db_path)
+    try:
+        query = """
+            SELECT Latitude, Longitude, Year
+            FROM homicides 
+            WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+        """
+        yield from pd.read_sql_query(query, conn, chunksize=chunksize)
+    finally:
+        conn.close()
+
+def stream_crime_aggregates(chunksize=100_000):
+    """Fold every crime chunk into running heatmap grid bins"""
+    aggregates = StreamingAggregates()
+    for chunk in iter_crime_chunks(chunksize):
+        aggregates.update(chunk)
+    return aggregates
+
+def count_crimes_per_area_chunked(neighborhoods, chunksize=100_000):
+    """Count crime points per neighborhood polygon one chunk at a time"""
+    counts = pd.Series(0, index=neighborhoods.index)
+    for chunk in iter_crime_chunks(chunksize):
+        counts += count_crimes_per_area(to_points(chunk), neighborhoods)
+    return counts
+
+def count_crimes_per_area(crime_data, neighborhoods):
+    """Count crime points falling within each neighborhood polygon"""
+    # A single STRtree-backed spatial join instead of one within() scan per area
+    joined = gpd.sjoin(
+        crime_data[['geometry']],
+        neighborhoods[['geometry']],
+        how='inner',
+        predicate='within'
+    )
+    counts = joined['index_right'].value_counts()
+    return counts.reindex(neighborhoods.index, fill_value=0).astype(int)
+
+def count_crimes_by_area_code(neighborhoods, db_path='homicides.db', use_cube=True):
+    """Count crimes per neighborhood from Community Area codes, placing uncoded rows geometrically
+
+    Coded counts come from the materialized homicides_cube unless use_cube is False.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if use_cube:
+            ingest.migrate(conn)
+            coded = ingest.cube_counts(conn, 'community_area').drop(-1, errors='ignore')
+            coded = coded.rename_axis('area_numbe').rename('crime_count').reset_index()
+        else:
+            coded = pd.read_sql_query("""
+                SELECT CAST("Community Area" AS INTEGER) AS area_numbe, COUNT(*) AS crime_count
+                FROM homicides
+                WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+                  AND "Community Area" IS NOT NULL
+                GROUP BY 1
+            """, conn)
+        
+        # Rows with no code, or a code no boundary carries, fall back to point-in-polygon
+        area_numbers = pd.to_numeric(neighborhoods['area_numbe'], errors='coerce')
+        unmatched = sorted(set(coded['area_numbe']) - set(area_numbers.dropna().astype(int)))
+        uncoded = pd.read_sql_query(f"""
+            SELECT Latitude, Longitude
+            FROM homicides
+            WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+              AND ("Community Area" IS NULL
+                   OR CAST("Community Area" AS INTEGER) IN ({', '.join('?' * len(unmatched))}))
+        """, conn, params=unmatched)
+    finally:
+        conn.close()
+    
+    counts = area_numbers.map(coded.set_index('area_numbe')['crime_count']).fillna(0).astype(int)
+    if len(uncoded):
+        counts += count_crimes_per_area(to_points(uncoded), neighborhoods)
+    return counts
+
+def timed(timings, stage, func, *args, **kwargs):
+    """Call func and record its wall time under stage"""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+def print_timings(timings):
+    """Print the per-stage timing report"""
+    print("\nStage timings:")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<20} {seconds:8.3f}s")
+
+def create_chloropleth_map(refresh_boundaries=False, offline=False, tiles=False, heat_grid=False,
+                           cache=None, stream=False, chunksize=100_000, use_cube=True):
+    """Create chloropleth map of crime hotspots
+
+    With stream=True crime rows are read chunksize at a time into running
+    aggregates and the heatmap is always drawn from grid cells.
+    """
+    timings = {}
+    started = time.perf_counter()
     
-    print("Loading crime data...")
-    crime_data = load_crime_data()
+    # Load data; the boundary fetch and the SQLite load are independent, so overlap them
+    print("Loading neighborhood boundaries and crime data...")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        boundaries = pool.submit(
+            timed, timings, 'Load boundaries', load_chicago_neighborhoods,
+            refresh=refresh_boundaries, offline=offline
+        )
+        if stream:
+            crimes = pool.submit(timed, timings, 'Stream crime data', stream_crime_aggregates, chunksize)
+        else:
+            # Points stay plain coordinates; only the geometric count fallback needs shapely objects
+            crimes = pool.submit(timed, timings, 'Load crime data', load_crime_data, as_geometry=False)
+        neighborhoods = boundaries.result()
+        crime_data = crimes.result()
+    timings['Load (wall time)'] = time.perf_counter() - started
     
     if neighborhoods is None or crime_data is None:
         print("Error: Could not load required data")
@@ -57,10 +257,19 @@ def create_chloropleth_map():
     
     # Count crimes per neighborhood
     print("Analyzing crime patterns...")
-    neighborhoods['crime_count'] = 0
-    for idx, neighborhood in neighborhoods.iterrows():
-        crime_count = sum(crime_data.geometry.within(neighborhood.geometry))
-        neighborhoods.at[idx, 'crime_count'] = crime_count
+    if 'area_numbe' in neighborhoods.columns:
+        neighborhoods['crime_count'] = timed(
+            timings, 'Count crimes', count_crimes_by_area_code, neighborhoods, use_cube=use_cube
+        )
+    elif stream:
+        neighborhoods['crime_count'] = timed(
+            timings, 'Count crimes', count_crimes_per_area_chunked, neighborhoods, chunksize
+        )
+    else:
+        neighborhoods['crime_count'] = timed(
+            timings, 'Count crimes', count_crimes_per_area, to_points(crime_data), neighborhoods
+        )
+    map_started = time.perf_counter()
     
     # Calculate crime rate per 1000 residents
     neighborhoods['crime_density'] = neighborhoods['crime_count'] / neighborhoods.geometry.area * 1e7
@@ -82,9 +291,14 @@ def create_chloropleth_map():
         caption='Crime Density (incidents per area)'
     )
     
-    # Add chloropleth layer
+    # Add chloropleth layer, reusing the serialized boundaries while they and the counts are unchanged
+    neighborhoods_json = cached(
+        cache, 'choropleth',
+        (neighborhoods.drop(columns='geometry'), b''.join(shapely.to_wkb(neighborhoods.geometry.values))),
+        neighborhoods.to_json
+    )
     folium.GeoJson(
-        neighborhoods,
+        neighborhoods_json,
         name='Crime Density',
         style_function=lambda feature: {
             'fillColor': color_map(feature['properties']['crime_density']),
@@ -130,18 +344,44 @@ def create_chloropleth_map():
     """
     m.get_root().html.add_child(folium.Element(legend_html))
     
-    # Add heatmap layer
-    print("Adding heatmap layer...")
-    heat_data = [[row['Latitude'], row['Longitude']] for idx, row in crime_data.iterrows()]
-    plugins.HeatMap(heat_data, radius=15, blur=10).add_to(m)
+    output_file = 'chicago_crime_hotspots.html'
+    if tiles:
+        # Incidents come from a vector-tile pyramid instead of raw points in the page
+        tile_dir = os.path.splitext(output_file)[0] + '_tiles'
+        print(f"Writing vector tiles to {tile_dir}/...")
+        build_tile_pyramid(
+            crime_data, tile_dir, areas=neighborhoods,
+            area_properties=('area_numbe', 'community', 'crime_count')
+        )
+        VectorTileLayer(tile_dir + '/{z}/{x}/{y}.pbf', name='Incidents', show_areas=False).add_to(m)
+    elif stream:
+        # Streamed runs never hold every point, only the grid bins accumulated per chunk
+        print("Adding heatmap layer...")
+        levels = json.dumps(crime_data.heat_levels(), separators=(',', ':'))
+        GridHeatMap(levels, radius=15, blur=10).add_to(m)
+    else:
+        # Add heatmap layer
+        print("Adding heatmap layer...")
+        heat = cached(
+            cache, 'heatmap',
+            (pd.DataFrame(crime_data[['Latitude', 'Longitude']]), heat_grid),
+            lambda: heat_payload(crime_data, heat_grid)
+        )
+        if heat_grid:
+            GridHeatMap(heat, radius=15, blur=10).add_to(m)
+        else:
+            JsonHeatMap(heat, radius=15, blur=10).add_to(m)
     
     # Add layer control
     folium.LayerControl().add_to(m)
     
+    timings['Build map'] = time.perf_counter() - map_started
+    
     # Save map
-    output_file = 'chicago_crime_hotspots.html'
-    m.save(output_file)
+    timed(timings, 'Save map', m.save, output_file)
     print(f"Map saved as {output_file}")
+    timings['Total'] = time.perf_counter() - started
+    print_timings(timings)
     
     # Print statistics
     print("\nCrime Statistics by Neighborhood:")
@@ -150,9 +390,33 @@ def create_chloropleth_map():
     print(stats.to_string(index=False))
 
 def main():
+    parser = argparse.ArgumentParser(description="Chicago crime hotspot analysis")
+    parser.add_argument('--refresh-boundaries', action='store_true',
+                        help="revalidate the cached community area boundaries against the data portal")
+    parser.add_argument('--offline', action='store_true',
+                        help="never touch the network; use cached or bundled boundaries only")
+    parser.add_argument('--tiles', action='store_true',
+                        help="serve incidents from a vector-tile pyramid instead of a raw-point heatmap")
+    parser.add_argument('--heat-grid', action='store_true',
+                        help="emit the heatmap from precomputed multi-zoom grid cells instead of raw points")
+    parser.add_argument('--cache-dir', default='.build_cache',
+                        help="directory of cached map sections reused across runs")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild every section from scratch")
+    parser.add_argument('--no-cube', action='store_true',
+                        help="count incidents per area from raw rows instead of the homicides_cube rollup")
+    parser.add_argument('--stream', action='store_true',
+                        help="read crime rows in chunks with bounded memory; implies a grid heatmap")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="rows per chunk with --stream")
+    args = parser.parse_args()
+    if args.stream and args.tiles:
+        parser.error("--tiles needs every incident in memory and cannot be combined with --stream")
+    
     try:
         print("Starting hotspot analysis...")
-        create_chloropleth_map()
+        create_chloropleth_map(refresh_boundaries=args.refresh_boundaries, offline=args.offline,
+                               tiles=args.tiles, heat_grid=args.heat_grid,
+                               cache=None if args.no_cache else BuildCache(args.cache_dir),
+                               stream=args.stream, chunksize=args.chunksize, use_cube=not args.no_cube)
         print("\nAnalysis complete! Open chicago_crime_hotspots.html in your web browser to view the map.")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -0,0 +1,302 @@
+import argparse
+import sqlite3
+import pandas as pd
+
+# Format the Chicago data portal uses for Date and Updated On, e.g. '05/24/2021 03:06:00 PM'
+PORTAL_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+# Canonical timestamp stored alongside the raw portal string; sortable and understood by SQLite
+ISO_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Derived columns persisted by the ingest step (dow: Monday=0 ... Sunday=6)
+DATE_COLUMNS = {
+    'date_iso': 'TEXT',
+    'dow': 'INTEGER',
+    'hour': 'INTEGER',
+    'month': 'INTEGER',
+}
+
+# Columns of the Chicago "Crimes - 2001 to Present" export, in portal order
+PORTAL_COLUMNS = [
+    'ID', 'Case Number', 'Date', 'Block', 'IUCR', 'Primary Type', 'Description',
+    'Location Description', 'Arrest', 'Domestic', 'Beat', 'District', 'Ward',
+    'Community Area', 'FBI Code', 'X Coordinate', 'Y Coordinate', 'Year',
+    'Updated On', 'Latitude', 'Longitude', 'Location'
+]
+
+# Code-like columns that must stay text (IUCR '0110' would otherwise lose its leading zero)
+TEXT_COLUMNS = {'Case Number': str, 'Block': str, 'IUCR': str, 'FBI Code': str}
+
+# Bound parameters per statement that SQLite accepts before 3.32 (SQLITE_MAX_VARIABLE_NUMBER)
+MAX_SQL_PARAMETERS = 999
+
+# Columns the dashboards filter or group on
+INDEXED_COLUMNS = ['Year', 'date_iso', 'Community Area', 'District', 'Primary Type', 'Location Description']
+
+def table_columns(conn, table='homicides'):
+    """Return the set of column names of a table"""
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+def parse_portal_dates(values):
+    """Parse portal date strings with the explicit portal format"""
+    return pd.to_datetime(pd.Series(values), format=PORTAL_DATE_FORMAT)
+
+def derive_date_columns(dates):
+    """Compute the canonical timestamp and derived columns for parsed datetimes"""
+    dates = pd.Series(dates).reset_index(drop=True)
+    return pd.DataFrame({
+        'date_iso': dates.dt.strftime(ISO_DATE_FORMAT),
+        'dow': dates.dt.dayofweek,
+        'hour': dates.dt.hour,
+        'month': dates.dt.month,
+    })
+
+def date_columns(values):
+    """Compute the canonical timestamp and derived columns for raw portal dates"""
+    return derive_date_columns(parse_portal_dates(values))
+
+def ensure_date_columns(conn, chunksize=100_000):
+    """Parse Date once and persist date_iso, dow, hour and month for rows missing them
+
+    Rows are parsed and committed in rowid batches of chunksize, so memory stays
+    bounded and an interrupted backfill resumes where it stopped.
+    """
+    existing = table_columns(conn)
+    for column, sql_type in DATE_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE homicides ADD COLUMN {column} {sql_type}')
+    for column in DATE_COLUMNS:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_homicides_{column} ON homicides ({column})')
+    conn.commit()
+
+    total = last_rowid = 0
+    while True:
+        rows = conn.execute("""
+            SELECT rowid, Date FROM homicides
+            WHERE date_iso IS NULL AND Date IS NOT NULL AND rowid > ?
+            ORDER BY rowid LIMIT ?
+        """, (last_rowid, chunksize)).fetchall()
+        if not rows:
+            return total
+        rowids, raw_dates = zip(*rows)
+        derived = date_columns(raw_dates)
+        conn.executemany(
+            'UPDATE homicides SET date_iso = ?, dow = ?, hour = ?, month = ? WHERE rowid = ?',
+            zip(*(derived[column].tolist() for column in DATE_COLUMNS), rowids)
+        )
+        conn.commit()
+        total += len(rows)
+        last_rowid = rowids[-1]
+
+def create_indexes(conn):
+    """Create the indexes used by year, date, area, district and type filters"""
+    for column in INDEXED_COLUMNS:
+        name = column.lower().replace(' ', '_')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_homicides_{name} ON homicides ("{column}")')
+    conn.commit()
+
+def build_rtree(conn):
+    """Index incident coordinates in an R*Tree keyed by homicides rowid"""
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS homicides_rtree
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+    # Rows are only ever appended, so index everything past the highest rowid seen
+    conn.execute("""
+        INSERT INTO homicides_rtree
+        SELECT rowid, Latitude, Latitude, Longitude, Longitude
+        FROM homicides
+        WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+          AND rowid > (SELECT COALESCE(MAX(id), 0) FROM homicides_rtree)
+    """)
+    conn.commit()
+
+def parameter_batches(values, size=MAX_SQL_PARAMETERS):
+    """Split values into lists small enough to bind as one IN (...) list"""
+    values = list(values)
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+def refresh_rtree_rows(conn, rowids):
+    """Re-index the coordinates of rows updated in place"""
+    for batch in parameter_batches(rowids):
+        placeholders = ', '.join('?' * len(batch))
+        conn.execute(f'DELETE FROM homicides_rtree WHERE id IN ({placeholders})', batch)
+        conn.execute(f"""
+            INSERT INTO homicides_rtree
+            SELECT rowid, Latitude, Latitude, Longitude, Longitude
+            FROM homicides
+            WHERE rowid IN ({placeholders}) AND Latitude IS NOT NULL AND Longitude IS NOT NULL
+        """, batch)
+
+# Dimensions of the homicides_cube rollup: cube column -> source expression.
+# Missing codes are stored as -1 / '' so equal groups always collide on the primary key.
+CUBE_DIMENSIONS = {
+    'year': 'CAST(IFNULL(Year, -1) AS INTEGER)',
+    'month': 'IFNULL(month, -1)',
+    'dow': 'IFNULL(dow, -1)',
+    'hour': 'IFNULL(hour, -1)',
+    'community_area': 'CAST(IFNULL("Community Area", -1) AS INTEGER)',
+    'district': 'CAST(IFNULL(District, -1) AS INTEGER)',
+    'location_description': 'IFNULL("Location Description", \'\')',
+}
+
+def build_cube(conn, full=False):
+    """Materialize incident counts over CUBE_DIMENSIONS into homicides_cube
+
+    Only rows appended since the last refresh are folded in; pass full=True
+    after rows were updated in place. Rows without coordinates are left out,
+    matching what the map and choropleth count.
+    """
+    dimensions = ', '.join(CUBE_DIMENSIONS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS homicides_cube (
+            {', '.join(f'{column} NOT NULL' for column in CUBE_DIMENSIONS)},
+            incidents INTEGER NOT NULL,
+            PRIMARY KEY ({dimensions})
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS homicides_cube_state (max_rowid INTEGER NOT NULL)")
+    if full:
+        conn.execute("DELETE FROM homicides_cube")
+        conn.execute("DELETE FROM homicides_cube_state")
+
+    max_rowid = conn.execute("SELECT MAX(max_rowid) FROM homicides_cube_state").fetchone()[0] or 0
+    last_rowid = conn.execute("SELECT MAX(rowid) FROM homicides").fetchone()[0] or 0
+    if last_rowid > max_rowid:
+        conn.execute(f"""
+            INSERT INTO homicides_cube ({dimensions}, incidents)
+            SELECT {', '.join(CUBE_DIMENSIONS.values())}, COUNT(*)
+            FROM homicides
+            WHERE rowid > ? AND rowid <= ?
+              AND Latitude IS NOT NULL AND Longitude IS NOT NULL
+            GROUP BY {', '.join(str(i) for i in range(1, len(CUBE_DIMENSIONS) + 1))}
+            ON CONFLICT ({dimensions}) DO UPDATE SET incidents = incidents + excluded.incidents
+        """, (max_rowid, last_rowid))
+        conn.execute("DELETE FROM homicides_cube_state")
+        conn.execute("INSERT INTO homicides_cube_state (max_rowid) VALUES (?)", (last_rowid,))
+    conn.commit()
+
+def cube_counts(conn, dimension, years=None):
+    """Return incident counts per value of one cube dimension, optionally for some years"""
+    where, params = '', []
+    if years is not None:
+        years = list(years)
+        where = f'WHERE year IN ({", ".join("?" * len(years))})'
+        params = years
+    query = f"""
+        SELECT {dimension} AS value, SUM(incidents) AS count
+        FROM homicides_cube
+        {where}
+        GROUP BY {dimension}
+        ORDER BY {dimension}
+    """
+    counts = pd.read_sql_query(query, conn, params=params)
+    return counts.set_index('value')['count']
+
+def filter_clause(years=None, bbox=None):
+    """Build a WHERE fragment and parameters for optional year and bounding-box filters
+
+    bbox is (min_lat, min_lon, max_lat, max_lon), inclusive. The R*Tree stores float32
+    boxes rounded outward, so it is searched for overlap to narrow the candidates
+    and the exact coordinates decide points on the edge.
+    """
+    clauses, params = [], []
+    if years is not None:
+        years = list(years)
+        clauses.append(f'Year IN ({", ".join("?" * len(years))})')
+        params.extend(years)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        clauses.append("""rowid IN (
+            SELECT id FROM homicides_rtree
+            WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+        )""")
+        params.extend([min_lat, max_lat, min_lon, max_lon])
+        clauses.append('Latitude BETWEEN ? AND ? AND Longitude BETWEEN ? AND ?')
+        params.extend([min_lat, max_lat, min_lon, max_lon])
+    return ' AND '.join(clauses), params
+
+def table_exists(conn, name):
+    """Return whether a table or virtual table exists"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def needs_migration(conn):
+    """Return whether any derived column, index, R*Tree row or cube row is missing, without writing"""
+    if not set(DATE_COLUMNS) <= table_columns(conn):
+        return True
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    expected = [column.lower().replace(' ', '_') for column in list(DATE_COLUMNS) + INDEXED_COLUMNS]
+    if not {f'idx_homicides_{name}' for name in expected} <= indexes:
+        return True
+    if not all(table_exists(conn, table) for table in ['homicides_rtree', 'homicides_cube', 'homicides_cube_state']):
+        return True
+    return bool(conn.execute("""
+        SELECT EXISTS (SELECT 1 FROM homicides WHERE date_iso IS NULL AND Date IS NOT NULL)
+            OR EXISTS (
+                SELECT 1 FROM homicides
+                WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+                  AND rowid > (SELECT COALESCE(MAX(id), 0) FROM homicides_rtree)
+            )
+            OR (SELECT COALESCE(MAX(rowid), 0) FROM homicides)
+               > (SELECT COALESCE(MAX(max_rowid), 0) FROM homicides_cube_state)
+    """).fetchone()[0])
+
+def migrate(conn):
+    """Bring an existing database up to the current schema
+
+    Checks first and only writes when something is missing, so an up-to-date
+    database can be opened read-only or while another process holds the lock.
+    """
+    if not needs_migration(conn):
+        return
+    ensure_date_columns(conn)
+    create_indexes(conn)
+    build_rtree(conn)
+    build_cube(conn)
+
+def ingest_csv(csv_path, db_path='homicides.db', primary_type='HOMICIDE', chunksize=100_000):
+    """Append a raw Chicago crime CSV export to the database and migrate it"""
+    conn = sqlite3.connect(db_path)
+    total = 0
+    try:
+        # Chunks carry the derived date columns, so an existing table needs them first
+        if table_exists(conn, 'homicides'):
+            migrate(conn)
+        for chunk in pd.read_csv(csv_path, usecols=PORTAL_COLUMNS, dtype=TEXT_COLUMNS, chunksize=chunksize):
+            if primary_type is not None:
+                chunk = chunk[chunk['Primary Type'] == primary_type]
+            if chunk.empty:
+                continue
+            chunk = chunk[PORTAL_COLUMNS].reset_index(drop=True)
+            # Parse dates while the chunk is in memory so migrate() has nothing left to do
+            chunk = pd.concat([chunk, date_columns(chunk['Date'])], axis=1)
+            chunk.to_sql('homicides', conn, if_exists='append', index=False)
+            total += len(chunk)
+            print(f"Ingested {total} rows...")
+        migrate(conn)
+    finally:
+        conn.close()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or migrate homicides.db")
+    parser.add_argument('csv', nargs='?',
+                        help="raw Chicago crime CSV export to append; omit to only migrate")
+    parser.add_argument('--db', default='homicides.db', help="SQLite database to write")
+    parser.add_argument('--primary-type', default='HOMICIDE',
+                        help="only keep rows of this Primary Type")
+    parser.add_argument('--all-types', action='store_true', help="keep every Primary Type")
+    args = parser.parse_args()
+    
+    if args.csv:
+        primary_type = None if args.all_types else args.primary_type
+        total = ingest_csv(args.csv, args.db, primary_type=primary_type)
+        print(f"Done! Ingested {total} rows into {args.db}")
+    else:
+        conn = sqlite3.connect(args.db)
+        migrate(conn)
+        conn.close()
+        print(f"Done! Migrated {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,545 @@
+import argparse
+import base64
 import folium
+import itertools
+import json
+import os
 import sqlite3
+import numpy as np
 import pandas as pd
-from folium.plugins import HeatMap, MarkerCluster
+from concurrent.futures import ProcessPoolExecutor
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import FastMarkerCluster, HeatMap
+from folium.template import Template
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
 from datetime import datetime
 import calendar
+import ingest
+from aggregates import StreamingAggregates
+from build_cache import BuildCache, cached, content_hash
+from heatmap import GridHeatMap, heat_grid_pyramid
+from hotspots import load_chicago_neighborhoods
+from tiles import VectorTileLayer, build_tile_pyramid, incident_style
 
-def load_data():
-    conn = sqlite3.connect('homicides.db')
-    query = """
-        SELECT *, 
-        strftime('%w', Date) as day_of_week,
-        strftime('%H', Date) as hour_of_day,
-        strftime('%m', Date) as month
+# Columns each dashboard section reads from the homicides table
+LAYER_COLUMNS = ['Year', 'Latitude', 'Longitude', 'Case Number', 'Date', 'Description']
+ANALYTICS_COLUMNS = ['Date', 'Location Description']
+
+# Compact dtypes applied at load time instead of letting pandas infer them
+COLUMN_DTYPES = {
+    'Year': 'int16',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Description': 'category',
+    'Location Description': 'category',
+    'Arrest': 'bool',
+    'Domestic': 'bool',
+}
+
+DAY_NAMES = list(calendar.day_name)
+MONTH_NAMES = list(calendar.month_name)[1:]
+SEASONS = ['Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer',
+           'Summer', 'Summer', 'Fall', 'Fall', 'Fall', 'Winter']
+
+# Plotly build loaded from the CDN unless the dashboard vendors its own copy
+PLOTLY_CDN = 'https://cdn.plot.ly/plotly-latest.min.js'
+
+def data_query(columns, years=None, bbox=None):
+    # SELECT over the requested columns plus the persisted date parts, with its dtypes
+    select = [
+        'date_iso AS Date' if column == 'Date' else f'"{column}"'
+        for column in columns
+    ]
+    where, params = ingest.filter_clause(years=years, bbox=bbox)
+    # Rows without a parseable Date carry -1 date parts, as in homicides_cube
+    query = f"""
+        SELECT {', '.join(select)}, IFNULL(dow, -1) AS dow, IFNULL(hour, -1) AS hour,
+               IFNULL(month, -1) AS month
         FROM homicides 
         WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+        {'AND ' + where if where else ''}
     """
-    data = pd.read_sql_query(query, conn)
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in columns}
+    dtypes.update({'dow': 'int8', 'hour': 'int8', 'month': 'int8'})
+    return query, params, dtypes
+
+def add_derived_columns(data):
+    # Add derived columns from the persisted integer parts; no datetime parsing needed
+    # -1 codes (undated rows) become missing categories
+    month_codes = np.where(data['month'] > 0, data['month'] - 1, -1)
+    data['day_name'] = pd.Categorical.from_codes(data['dow'], categories=DAY_NAMES)
+    data['month_name'] = pd.Categorical.from_codes(month_codes, categories=MONTH_NAMES)
+    data['season'] = pd.Categorical(
+        np.append(SEASONS, None)[month_codes],
+        categories=['Winter', 'Spring', 'Summer', 'Fall']
+    )
+    return data
+
+def load_data(columns=LAYER_COLUMNS + ANALYTICS_COLUMNS, years=None, bbox=None):
+    columns = list(dict.fromkeys(columns))
+    conn = sqlite3.connect('homicides.db')
+    # Parses dates, builds indexes and the R*Tree; no-op once migrated
+    ingest.migrate(conn)
+    query, params, dtypes = data_query(columns, years, bbox)
+    data = pd.read_sql_query(query, conn, params=params, dtype=dtypes)
     conn.close()
     
-    # Convert date string to datetime
-    data['Date'] = pd.to_datetime(data['Date'])
-    
-    # Add derived columns
-    data['day_name'] = data['Date'].dt.day_name()
-    data['hour'] = data['Date'].dt.hour
-    data['month_name'] = data['Date'].dt.month_name()
-    data['season'] = data['Date'].dt.month.map(lambda x: 
-        'Winter' if x in [12, 1, 2] else
-        'Spring' if x in [3, 4, 5] else
-        'Summer' if x in [6, 7, 8] else 'Fall')
-    
-    return data
+    return add_derived_columns(data)
+
+def iter_data_chunks(columns=LAYER_COLUMNS + ANALYTICS_COLUMNS, chunksize=100_000, years=None, bbox=None):
+    # Same rows as load_data, but yielded chunksize rows at a time so memory stays bounded
+    columns = list(dict.fromkeys(columns))
+    conn = sqlite3.connect('homicides.db')
+    try:
+        ingest.migrate(conn)
+        query, params, dtypes = data_query(columns, years, bbox)
+        for chunk in pd.read_sql_query(query, conn, params=params, dtype=dtypes, chunksize=chunksize):
+            yield add_derived_columns(chunk)
+    finally:
+        conn.close()
+
+def stream_aggregates(chunksize=100_000, years=None, bbox=None):
+    # Fold every chunk into running analytics counts and per-year heatmap grid bins
+    aggregates = StreamingAggregates()
+    columns = ['Year', 'Latitude', 'Longitude', 'Location Description']
+    for chunk in iter_data_chunks(columns, chunksize, years, bbox):
+        aggregates.update(chunk)
+        print(f"Aggregated {aggregates.rows} rows...")
+    return aggregates
 
 def initialize_map():
     return folium.Map(location=[41.8781, -87.6298], zoom_start=11)
 
-def create_layers(data, map_object):
-    year_layers = {}
-    heatmap_layers = {}
-    cluster_layers = {}
+def partition_data(data, keys=('Year',)):
+    # Sort once by the partition keys and hand out contiguous row ranges per key,
+    # so every consumer shares the same O(N) pass instead of masking per key
+    keys = list(keys)
+    ordered = data.sort_values(keys, kind='stable')
+    columns = [ordered[key].to_numpy() for key in keys]
+    starts = np.zeros(len(ordered), dtype=bool)
+    starts[:1] = True
+    for values in columns:
+        missing = pd.isna(values)
+        same = (values[1:] == values[:-1]) | (missing[1:] & missing[:-1])
+        starts[1:] |= ~same
+    bounds = np.append(np.flatnonzero(starts), len(ordered))
     
-    for year in range(2020, 2025):
-        cluster_layer = folium.FeatureGroup(name=f'cluster_year_{year}')
-        marker_cluster = MarkerCluster()
-        
-        year_data = data[data['Year'] == year]
-        
-        for _, row in year_data.iterrows():
-            folium.Marker(
-                location=[row['Latitude'], row['Longitude']],
-                popup=f"Case Number: {row['Case Number']}<br>Date: {row['Date']}<br>Description: {row['Description']}",
-                icon=folium.Icon(color='red', icon='info-sign')
-            ).add_to(marker_cluster)
-        
-        marker_cluster.add_to(cluster_layer)
-        
-        heatmap_layer = folium.FeatureGroup(name=f'heatmap_year_{year}')
-        heat_data = [[row['Latitude'], row['Longitude']] for _, row in year_data.iterrows()]
-        HeatMap(heat_data, radius=15).add_to(heatmap_layer)
-        
-        cluster_layer.add_to(map_object)
-        heatmap_layer.add_to(map_object)
-        
-        map_object.get_root().html.add_child(folium.Element(
-            f"""
-            <script>
-                document.addEventListener('DOMContentLoaded', function() {{
-                    document.querySelector('input[type="checkbox"][layername="heatmap_year_{year}"]').click();
-                }});
-            </script>
-            """
-        ))
-        
-        cluster_layers[str(year)] = cluster_layer
-        heatmap_layers[str(year)] = heatmap_layer
+    partition_keys = zip(*(values[bounds[:-1]].tolist() for values in columns))
+    return {
+        key if len(keys) > 1 else key[0]: ordered.iloc[start:stop]
+        for key, start, stop in zip(partition_keys, bounds[:-1].tolist(), bounds[1:].tolist())
+    }
+
+# Client-side year filter behind the control panel. Every incident lives in one
+# Float32Array of [lat, lon] pairs ordered by year, so a year is just an index range;
+# switching years or modes rebuilds only the single visible cluster or heatmap layer
+YEAR_FILTER_JS = """function (map, points, options) {
+    var ranges = {};
+    var total = 0;
+    points.years.forEach(function (entry) {
+        ranges[entry.year] = entry;
+        total += entry.count;
+    });
+    var icon = L.AwesomeMarkers.icon({icon: 'info-sign', markerColor: 'red', prefix: 'glyphicon'});
+    var markers = new Array(total);
+    var heatCache = {};
+    var popupChunks = {};
+    var cluster = L.markerClusterGroup({chunkedLoading: true});
+    var heat = L.heatLayer([], options.heat);
+    var current = {year: null, mode: null};
     
-    return cluster_layers, heatmap_layers
+    function range(year) {
+        if (year === 'all') {
+            return [0, total];
+        }
+        var entry = ranges[year];
+        return entry ? [entry.offset, entry.offset + entry.count] : [0, 0];
+    }
+    
+    function marker(i) {
+        if (!markers[i]) {
+            markers[i] = L.marker([points.coords[2 * i], points.coords[2 * i + 1]], {icon: icon, index: i});
+        }
+        return markers[i];
+    }
+    
+    function popupHtml(columns, j) {
+        return 'Case Number: ' + columns.case_numbers[j] + '<br>Date: ' + columns.dates[j] +
+               '<br>Description: ' + columns.descriptions[columns.description_codes[j]];
+    }
+    
+    function openPopup(i, latlng) {
+        // Popups are only rendered on click; chunked builds fetch a year's attributes once
+        var popup = L.popup().setLatLng(latlng);
+        if (!points.popup_url) {
+            popup.setContent(popupHtml(points, i)).openOn(map);
+            return;
+        }
+        var entry = points.years.filter(function (entry) {
+            return i >= entry.offset && i < entry.offset + entry.count;
+        })[0];
+        if (!popupChunks[entry.year]) {
+            popupChunks[entry.year] = fetch(points.popup_url.replace('{year}', entry.year))
+                .then(function (response) { return response.json(); });
+        }
+        popup.setContent('Loading...').openOn(map);
+        popupChunks[entry.year].then(function (columns) {
+            popup.setContent(popupHtml(columns, i - entry.offset));
+        });
+    }
+    
+    cluster.on('click', function (e) {
+        openPopup(e.layer.options.index, e.layer.getLatLng());
+    });
+    
+    function heatPoints(year) {
+        if (points.heat) {
+            // Precomputed grid levels: use the finest one at or below the current zoom
+            var levels = points.heat[year] || {};
+            var zooms = Object.keys(levels).map(Number).sort(function (a, b) { return a - b; });
+            var level = zooms[0];
+            zooms.forEach(function (z) {
+                if (z <= map.getZoom()) {
+                    level = z;
+                }
+            });
+            return level === undefined ? [] : levels[level];
+        }
+        if (!heatCache[year]) {
+            var bounds = range(year);
+            var latlngs = new Array(bounds[1] - bounds[0]);
+            for (var i = bounds[0]; i < bounds[1]; i++) {
+                latlngs[i - bounds[0]] = [points.coords[2 * i], points.coords[2 * i + 1]];
+            }
+            heatCache[year] = latlngs;
+        }
+        return heatCache[year];
+    }
+    
+    function show(year, mode) {
+        if (year === current.year && mode === current.mode) {
+            return;
+        }
+        if (mode === 'heatmap') {
+            map.removeLayer(cluster);
+            heat.setLatLngs(heatPoints(year));
+            if (!map.hasLayer(heat)) {
+                heat.addTo(map);
+            }
+        } else {
+            map.removeLayer(heat);
+            var bounds = range(year);
+            var visible = new Array(bounds[1] - bounds[0]);
+            for (var i = bounds[0]; i < bounds[1]; i++) {
+                visible[i - bounds[0]] = marker(i);
+            }
+            cluster.clearLayers();
+            cluster.addLayers(visible);
+            if (!map.hasLayer(cluster)) {
+                cluster.addTo(map);
+            }
+        }
+        current = {year: year, mode: mode};
+    }
+    
+    if (points.heat) {
+        map.on('zoomend', function () {
+            if (current.mode === 'heatmap') {
+                heat.setLatLngs(heatPoints(current.year));
+            }
+        });
+    }
+    return {show: show};
+}"""
+
+# Leaflet.heat options shared by the inline and sidecar year filters
+HEAT_OPTIONS = {'minOpacity': 0.5, 'maxZoom': 18, 'radius': 15, 'blur': 15}
 
-def create_analytics_html(data):
-    # Define color scheme
-    colors = {
-        'primary': '#1f77b4',
-        'secondary': '#ff7f0e',
-        'accent': '#2ca02c',
-        'background': '#f8f9fa',
-        'text': '#2c3e50'
+# Marker popup attributes, stored column-wise and rendered in the browser on click
+POPUP_COLUMNS = ['case_numbers', 'dates', 'descriptions', 'description_codes']
+
+def popup_columns(year_data):
+    # Columnar popup attributes for one year; descriptions are codes into the year's own
+    # table, so a value first seen in another year leaves this year's payload unchanged
+    descriptions = year_data['Description'].cat.remove_unused_categories()
+    return {
+        'case_numbers': year_data['Case Number'].tolist(),
+        'dates': year_data['Date'].astype(object).where(year_data['Date'].notna(), None).tolist(),
+        'descriptions': descriptions.cat.categories.tolist(),
+        'description_codes': descriptions.cat.codes.tolist(),
     }
+
+def write_popup_chunks(partitions, out_dir):
+    # One popup attribute JSON file per year, fetched the first time one of its markers
+    # is clicked; returns the URL template relative to the HTML
+    os.makedirs(out_dir, exist_ok=True)
+    for year, year_data in partitions.items():
+        with open(os.path.join(out_dir, f'{year}.json'), 'w', encoding='utf-8') as f:
+            json.dump(popup_columns(year_data), f, separators=(',', ':'))
+    return os.path.basename(out_dir) + '/{year}.json'
+
+def build_year_payload(year_data, heat_grid=False):
+    # One year's incidents in columnar form: base64 little-endian Float32 [lat, lon]
+    # pairs plus the popup columns, and the grid heatmap levels if requested
+    coords = year_data[['Latitude', 'Longitude']].to_numpy(dtype='<f4')
+    return {
+        'coords': base64.b64encode(coords.tobytes()).decode('ascii'),
+        **popup_columns(year_data),
+        'heat': heat_grid_pyramid(year_data) if heat_grid else None,
+    }
+
+def build_year_payloads(partitions, heat_grid=False, cache=None, jobs=1):
+    # Unchanged years come from the build cache; the rest are built serially or in a
+    # process pool. Results are keyed by year and consumed in partition order, so the
+    # output does not depend on which worker finishes first
+    keys = {}
+    payloads = {}
+    if cache is not None:
+        for year, year_data in partitions.items():
+            keys[year] = content_hash(year_data[LAYER_COLUMNS], heat_grid)
+            payloads[year] = cache.get(f'year_{year}', keys[year])
+    missing = [year for year in partitions if payloads.get(year) is None]
     
-    # 1. Day of Week Analysis
-    dow_counts = data['day_name'].value_counts().reindex([
-        'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {year: pool.submit(build_year_payload, partitions[year], heat_grid) for year in missing}
+            built = {year: future.result() for year, future in futures.items()}
+    else:
+        built = {year: build_year_payload(partitions[year], heat_grid) for year in missing}
+    
+    for year, payload in built.items():
+        payloads[year] = payload
+        if cache is not None:
+            cache.put(f'year_{year}', keys[year], payload)
+    return payloads
+
+class YearFilterLayers(JSCSSMixin):
+    # Every year's incidents embedded once and decoded into a single typed array,
+    # exposed to the control panel as window.yearLayers
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var data = {{ this.data_json }};
+            var points = {years: [], descriptions: [], case_numbers: [], dates: [],
+                          description_codes: [], heat: data.heat, popup_url: data.popup_url};
+            var total = data.years.reduce(function (sum, entry) { return sum + entry.count; }, 0);
+            points.coords = new Float32Array(2 * total);
+            var offset = 0;
+            data.years.forEach(function (entry) {
+                var bytes = Uint8Array.from(atob(entry.coords), function (c) { return c.charCodeAt(0); });
+                points.coords.set(new Float32Array(bytes.buffer), 2 * offset);
+                points.years.push({year: entry.year, offset: offset, count: entry.count});
+                if (!data.popup_url) {
+                    points.case_numbers = points.case_numbers.concat(entry.case_numbers);
+                    points.dates = points.dates.concat(entry.dates);
+                    // Shift each year's description codes past the tables of the years before it
+                    var base = points.descriptions.length;
+                    points.descriptions = points.descriptions.concat(entry.descriptions);
+                    points.description_codes = points.description_codes.concat(
+                        entry.description_codes.map(function (code) { return code < 0 ? code : code + base; })
+                    );
+                }
+                offset += entry.count;
+            });
+            window.yearLayers = ({{ this.filter_js }})({{ this._parent.get_name() }}, points,
+                                                      {heat: {{ this.heat_options|tojavascript }}});
+        })();
+        {% endmacro %}
+    """)
+    
+    default_js = HeatMap.default_js + FastMarkerCluster.default_js
+    default_css = FastMarkerCluster.default_css
+    
+    def __init__(self, data_json):
+        super().__init__()
+        self._name = 'YearFilterLayers'
+        self.data_json = data_json
+        self.filter_js = YEAR_FILTER_JS
+        self.heat_options = HEAT_OPTIONS
+
+def create_layers(data, map_object, heat_grid=False, cache=None, jobs=1, popup_dir=None):
+    # One sort yields every year present in the data; each year's payload is built once
+    partitions = partition_data(data, ['Year'])
+    payloads = build_year_payloads(partitions, heat_grid, cache, jobs)
+    years = [
+        {'year': year, 'count': len(partitions[year]), **payloads[year]}
+        for year in partitions
+    ]
+    
+    # With popup_dir the popup attributes move out of the page into per-year files
+    popup_url = None
+    if popup_dir is not None:
+        popup_url = write_popup_chunks(partitions, popup_dir)
+        for entry in years:
+            for column in POPUP_COLUMNS:
+                del entry[column]
+    heat = None
+    if heat_grid:
+        heat = {str(entry['year']): entry.pop('heat') for entry in years}
+        heat['all'] = cached(
+            cache, 'heat_all', (data[['Latitude', 'Longitude']],), lambda: heat_grid_pyramid(data)
+        )
+    else:
+        for entry in years:
+            entry.pop('heat')
+    
+    data_json = json.dumps(
+        {'years': years, 'heat': heat, 'popup_url': popup_url},
+        separators=(',', ':')
+    )
+    YearFilterLayers(data_json).add_to(map_object)
+    return [str(year) for year in partitions]
+
+class SidecarPointLayers(JSCSSMixin):
+    # Fetches the sidecar files written by write_point_sidecar and hands them to
+    # the same client-side year filter as the inline layers
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            Promise.all([
+                fetch({{ this.manifest_url|tojson }}).then(function (response) { return response.json(); }),
+                fetch({{ this.points_url|tojson }}).then(function (response) { return response.arrayBuffer(); })
+            ]).then(function (results) {
+                var points = results[0];
+                points.coords = new Float32Array(results[1]);
+                points.heat = null;
+                window.yearLayers = ({{ this.filter_js }})(map, points, {heat: {{ this.heat_options|tojavascript }}});
+                if (window.filterByYear) {
+                    window.filterByYear();
+                }
+            });
+        })();
+        {% endmacro %}
+    """)
+    
+    default_js = HeatMap.default_js + FastMarkerCluster.default_js
+    default_css = FastMarkerCluster.default_css
+    
+    def __init__(self, points_url, manifest_url):
+        super().__init__()
+        self._name = 'SidecarPointLayers'
+        self.points_url = points_url
+        self.manifest_url = manifest_url
+        self.filter_js = YEAR_FILTER_JS
+        self.heat_options = HEAT_OPTIONS
+
+def write_point_sidecar(partitions, stem):
+    # Coordinates go to one little-endian Float32 blob ordered by year, per-year offsets
+    # to a small JSON manifest, and popup attributes to per-year chunks fetched on click
+    frames = list(partitions.values())
+    coords = np.concatenate([
+        frame[['Latitude', 'Longitude']].to_numpy(dtype='<f4') for frame in frames
     ])
+    points_path = f'{stem}.points.bin'
+    coords.tofile(points_path)
+    
+    offsets = np.cumsum([0] + [len(frame) for frame in frames]).tolist()
+    manifest = {
+        'years': [
+            {'year': year, 'offset': offset, 'count': len(frame)}
+            for (year, frame), offset in zip(partitions.items(), offsets)
+        ],
+        'popup_url': write_popup_chunks(partitions, f'{stem}.popups'),
+    }
+    manifest_path = f'{stem}.points.json'
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    
+    return os.path.basename(points_path), os.path.basename(manifest_path)
+
+def create_sidecar_layers(data, map_object, stem):
+    # Same year filter as create_layers, but the points live in files next to the HTML
+    partitions = partition_data(data, ['Year'])
+    points_url, manifest_url = write_point_sidecar(partitions, stem)
+    SidecarPointLayers(points_url, manifest_url).add_to(map_object)
+    return [str(year) for year in partitions]
+
+class YearLayerSwitch(MacroElement):
+    # window.yearLayers over prebuilt per-year layers (streamed heatmaps):
+    # shows the selected year's layers of the active mode and removes the rest
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        window.yearLayers = (function () {
+            var map = {{ this._parent.get_name() }};
+            var layers = {
+                cluster: {
+                    {%- for year, layer in this.cluster_layers.items() %}
+                    {{ year|tojson }}: {{ layer.get_name() }},
+                    {%- endfor %}
+                },
+                heatmap: {
+                    {%- for year, layer in this.heatmap_layers.items() %}
+                    {{ year|tojson }}: {{ layer.get_name() }},
+                    {%- endfor %}
+                }
+            };
+            return {show: function (year, mode) {
+                Object.keys(layers).forEach(function (kind) {
+                    Object.keys(layers[kind]).forEach(function (layerYear) {
+                        var layer = layers[kind][layerYear];
+                        var visible = kind === mode && (year === 'all' || layerYear === year);
+                        if (visible && !map.hasLayer(layer)) {
+                            map.addLayer(layer);
+                        } else if (!visible && map.hasLayer(layer)) {
+                            map.removeLayer(layer);
+                        }
+                    });
+                });
+            }};
+        })();
+        {% endmacro %}
+    """)
     
+    def __init__(self, cluster_layers, heatmap_layers):
+        super().__init__()
+        self._name = 'YearLayerSwitch'
+        self.cluster_layers = cluster_layers
+        self.heatmap_layers = heatmap_layers
+
+class TileYearFilter(MacroElement):
+    # window.yearLayers over one vector-tile layer: the selected year and mode only
+    # restyle the same tiles, so every year shares one set of fetched tiles
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        window.yearLayers = (function () {
+            var map = {{ this._parent.get_name() }};
+            var layer = {{ this.layer.get_name() }};
+            return {show: function (year, mode) {
+                layer.setFilter(year === 'all' ? null : Number(year), mode);
+                if (!map.hasLayer(layer)) {
+                    map.addLayer(layer);
+                }
+            }};
+        })();
+        {% endmacro %}
+    """)
+    
+    def __init__(self, layer):
+        super().__init__()
+        self._name = 'TileYearFilter'
+        self.layer = layer
+
+def create_tile_layers(data, map_object, stem):
+    # One incident overlay drawn from a vector-tile pyramid next to the HTML, filtered by year in the browser
+    tile_dir = f'{stem}_tiles'
+    neighborhoods = load_chicago_neighborhoods()
+    print(f"Writing vector tiles to {tile_dir}/...")
+    build_tile_pyramid(data, tile_dir, areas=neighborhoods)
+    url = os.path.basename(tile_dir) + '/{z}/{x}/{y}.pbf'
+    
+    layer = VectorTileLayer(url, name='incidents', show=False, styles={
+        'cluster': incident_style(show_areas=neighborhoods is not None),
+        'heatmap': incident_style(radius=8, opacity=0.25, show_areas=False),
+    })
+    layer.add_to(map_object)
+    TileYearFilter(layer).add_to(map_object)
+    return [str(year) for year in np.unique(data['Year']).tolist()]
+
+def day_of_week_figure(dow_counts):
     fig_dow = go.Figure()
     fig_dow.add_trace(go.Bar(
         x=dow_counts.index,
@@ -107,10 +553,9 @@ def create_analytics_html(data):
         plot_bgcolor='white',
         height=400
     )
+    return fig_dow
 
-    # 2. Location Type Analysis
-    location_counts = data['Location Description'].value_counts().head(10)
-    
+def location_figure(location_counts):
     fig_location = go.Figure()
     fig_location.add_trace(go.Bar(
         x=location_counts.values,
@@ -126,12 +571,9 @@ def create_analytics_html(data):
         height=400,
         margin=dict(l=200)  # Add left margin for location labels
     )
+    return fig_location
 
-    # 3. Time of Day Analysis
-    hour_counts = data['hour'].value_counts().sort_index()
-    hour_labels = [f"{str(h%12 or 12)} {'AM' if h<12 else 'PM'}" for h in range(24)]
-    hour_counts.index = hour_labels
-
+def time_of_day_figure(hour_counts):
     fig_time = go.Figure()
     fig_time.add_trace(go.Scatter(
         x=hour_counts.index,
@@ -149,9 +591,9 @@ def create_analytics_html(data):
         height=400,
         xaxis_tickangle=45
     )
+    return fig_time
 
-    # 4. Seasonal Analysis
-    season_counts = data['season'].value_counts()
+def season_figure(season_counts):
     season_colors = ['#2980b9', '#27ae60', '#e74c3c', '#f39c12']
     
     fig_season = go.Figure()
@@ -167,7 +609,176 @@ def create_analytics_html(data):
         paper_bgcolor='white',
         height=400
     )
+    return fig_season
+
+def figure_json_html(name, figure):
+    # Empty chart container plus its figure JSON, drawn later by the hydration script
+    figure_json = figure.to_json().replace('</', '<\\/')
+    return f"""<div id="{name}" style="height: 400px;"></div>
+                <script type="application/json" data-chart="{name}">{figure_json}</script>"""
+
+def chart_html(name, counts, build_figure, cache=None, hydrate=False):
+    # Rendered chart fragment, reused from the cache while its counts are unchanged
+    if hydrate:
+        return cached(
+            cache, f'{name}_json',
+            (counts.index.astype(str).tolist(), counts.tolist()),
+            lambda: figure_json_html(name, build_figure(counts))
+        )
+    return cached(
+        cache, name,
+        (counts.index.astype(str).tolist(), counts.tolist()),
+        lambda: build_figure(counts).to_html(full_html=False, include_plotlyjs=False, div_id=name)
+    )
+
+# Draws the figure JSON containers once Plotly (possibly loaded with defer) is available.
+# Eager mode yields first so the map renders and becomes interactive before the charts;
+# lazy mode draws each chart only when its container scrolls near the viewport
+HYDRATE_CHARTS_JS = """
+    <script>
+    document.addEventListener('DOMContentLoaded', function() {
+        var lazy = %s;
+        var sources = document.querySelectorAll('script[data-chart]');
+        
+        function drawChart(source) {
+            var figure = JSON.parse(source.textContent);
+            Plotly.newPlot(source.dataset.chart, figure.data, figure.layout, {responsive: true});
+        }
+        
+        if (lazy && 'IntersectionObserver' in window) {
+            var observer = new IntersectionObserver(function(entries) {
+                entries.forEach(function(entry) {
+                    if (!entry.isIntersecting) {
+                        return;
+                    }
+                    observer.unobserve(entry.target);
+                    drawChart(document.querySelector('script[data-chart="' + entry.target.id + '"]'));
+                });
+            }, {rootMargin: '200px'});
+            sources.forEach(function(source) {
+                observer.observe(document.getElementById(source.dataset.chart));
+            });
+        } else {
+            (window.requestIdleCallback || setTimeout)(function() {
+                sources.forEach(drawChart);
+            });
+        }
+    });
+    </script>
+    """
+
+def vendor_plotly(output_dir, bundle=None):
+    # Write the Plotly bundle next to the dashboard and return its relative path. A partial
+    # build (e.g. plotly.js-basic-dist-min: bar, scatter, pie) can be passed as bundle;
+    # otherwise the full minified build shipped with the plotly package is used
+    if bundle is not None:
+        filename = os.path.basename(bundle)
+        with open(bundle, 'rb') as f:
+            source = f.read()
+    else:
+        filename = 'plotly.min.js'
+        source = get_plotlyjs().encode('utf-8')
+    
+    # Rewrite only when the contents differ, so an unchanged bundle keeps its mtime
+    path = os.path.join(output_dir, filename)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == source:
+                return filename
+    with open(path, 'wb') as f:
+        f.write(source)
+    return filename
+
+def analytics_counts(dow_counts, hour_counts, month_counts, location_counts):
+    # Chart-ready counts from raw tallies keyed by dow (Monday=0), hour, month and location type
+    
+    # 1. Day of Week Analysis
+    dow_counts = dow_counts.reindex(range(7), fill_value=0)
+    dow_counts.index = DAY_NAMES
+    
+    # 2. Location Type Analysis
+    location_counts = location_counts.sort_values(ascending=False, kind='stable').head(10)
+    
+    # 3. Time of Day Analysis
+    hour_counts = hour_counts.reindex(range(24), fill_value=0)
+    hour_labels = [f"{str(h%12 or 12)} {'AM' if h<12 else 'PM'}" for h in range(24)]
+    hour_counts.index = hour_labels
+    
+    # 4. Seasonal Analysis
+    month_counts = month_counts.reindex(range(1, 13), fill_value=0)
+    season_counts = month_counts.groupby(SEASONS, sort=False).sum()
+    season_counts = season_counts.sort_values(ascending=False, kind='stable')
+    
+    return {
+        'day_of_week': dow_counts,
+        'location': location_counts,
+        'time_of_day': hour_counts,
+        'season': season_counts,
+    }
+
+def sql_analytics_counts(years=None, bbox=None, db_path='homicides.db', use_cube=True):
+    # Analytics counts computed by SQLite GROUP BY; no rows are loaded. Reads the materialized
+    # homicides_cube unless a bounding box needs the raw rows
+    conn = sqlite3.connect(db_path)
+    ingest.migrate(conn)
+    where, params = ingest.filter_clause(years=years, bbox=bbox)
+    
+    def group_counts(column, cube_column):
+        if use_cube and bbox is None:
+            counts = ingest.cube_counts(conn, cube_column, years=years)
+            return counts[(counts.index != -1) & (counts.index != '')]
+        query = f"""
+            SELECT {column} AS value, COUNT(*) AS count
+            FROM homicides 
+            WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL AND {column} IS NOT NULL
+            {'AND ' + where if where else ''}
+            GROUP BY {column}
+            ORDER BY {column}
+        """
+        counts = pd.read_sql_query(query, conn, params=params)
+        return counts.set_index('value')['count']
+    
+    try:
+        return analytics_counts(
+            group_counts('dow', 'dow'),
+            group_counts('hour', 'hour'),
+            group_counts('month', 'month'),
+            group_counts('"Location Description"', 'location_description')
+        )
+    finally:
+        conn.close()
+
+def streamed_analytics_counts(aggregates):
+    # Analytics counts from the running totals of stream_aggregates
+    return analytics_counts(
+        aggregates.count('dow'),
+        aggregates.count('hour'),
+        aggregates.count('month'),
+        aggregates.count('location')
+    )
 
+def create_streamed_layers(aggregates, map_object):
+    # Heatmap-only overlays built from streamed grid bins; markers would need every row in memory
+    heatmap_layers = {}
+    for year in aggregates.years():
+        heatmap_layer = folium.FeatureGroup(name=f'heatmap_year_{year}', show=False)
+        levels = json.dumps(aggregates.heat_levels(year), separators=(',', ':'))
+        GridHeatMap(levels, radius=15).add_to(heatmap_layer)
+        heatmap_layer.add_to(map_object)
+        heatmap_layers[str(year)] = heatmap_layer
+    YearLayerSwitch({}, heatmap_layers).add_to(map_object)
+    return list(heatmap_layers)
+
+def create_analytics_html(counts, cache=None, hydrate=False, lazy=False):
+    # hydrate emits figure JSON drawn after the map; lazy also defers each chart until scrolled to
+    hydrate = hydrate or lazy
+    charts = [
+        chart_html('chart_day_of_week', counts['day_of_week'], day_of_week_figure, cache, hydrate),
+        chart_html('chart_location', counts['location'], location_figure, cache, hydrate),
+        chart_html('chart_time_of_day', counts['time_of_day'], time_of_day_figure, cache, hydrate),
+        chart_html('chart_season', counts['season'], season_figure, cache, hydrate),
+    ]
+    
     # Convert plots to HTML
     return f"""
     <div style="padding: 20px; background-color: #f5f5f5;">
@@ -176,62 +787,41 @@ def create_analytics_html(data):
         </h2>
         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 25px; margin-top: 20px;">
             <div style="background-color: white; padding: 20px; border-radius: 12px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                {fig_dow.to_html(full_html=False, include_plotlyjs=False)}
+                {charts[0]}
             </div>
             <div style="background-color: white; padding: 20px; border-radius: 12px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                {fig_location.to_html(full_html=False, include_plotlyjs=False)}
+                {charts[1]}
             </div>
             <div style="background-color: white; padding: 20px; border-radius: 12px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                {fig_time.to_html(full_html=False, include_plotlyjs=False)}
+                {charts[2]}
             </div>
             <div style="background-color: white; padding: 20px; border-radius: 12px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                {fig_season.to_html(full_html=False, include_plotlyjs=False)}
+                {charts[3]}
             </div>
         </div>
     </div>
-    """
+    {HYDRATE_CHARTS_JS % ('true' if lazy else 'false') if hydrate else ''}"""
 
-def add_control_panel(map_object):
+def add_control_panel(map_object, years, heatmap_mode=False, allow_toggle=True):
     js_code = """
     <script>
     document.addEventListener('DOMContentLoaded', function() {
-        var isHeatmapMode = false;
+        var isHeatmapMode = %s;
         
         function toggleViewMode() {
             isHeatmapMode = !isHeatmapMode;
-            var selectedYear = document.getElementById('yearSelect').value;
-            updateLayers(selectedYear);
+            filterByYear();
             
             document.getElementById('toggleButton').textContent = 
                 isHeatmapMode ? 'Switch to Cluster View' : 'Switch to Heatmap View';
         }
         
-        function updateLayers(selectedYear) {
-            var layers = document.querySelectorAll('.leaflet-control-layers-overlays label');
-            
-            layers.forEach(function(layer) {
-                var layerName = layer.querySelector('span').textContent.trim();
-                var checkbox = layer.querySelector('input[type="checkbox"]');
-                var isHeatmapLayer = layerName.startsWith('heatmap_');
-                var isClusterLayer = layerName.startsWith('cluster_');
-                var yearMatch = selectedYear === 'all' || layerName.endsWith(selectedYear);
-                
-                var shouldBeVisible = yearMatch && (
-                    (isHeatmapMode && isHeatmapLayer) || 
-                    (!isHeatmapMode && isClusterLayer)
-                );
-                
-                if (shouldBeVisible && !checkbox.checked) {
-                    checkbox.click();
-                } else if (!shouldBeVisible && checkbox.checked) {
-                    checkbox.click();
-                }
-            });
-        }
-        
         function filterByYear() {
+            // window.yearLayers is set by the map's layer builder; sidecar data may still be loading
             var selectedYear = document.getElementById('yearSelect').value;
-            updateLayers(selectedYear);
+            if (window.yearLayers) {
+                window.yearLayers.show(selectedYear, isHeatmapMode ? 'heatmap' : 'cluster');
+            }
         }
         
         window.filterByYear = filterByYear;
@@ -240,31 +830,42 @@ def add_control_panel(map_object):
         filterByYear();
     });
     </script>
-    """
+    """ % ('true' if heatmap_mode else 'false')
 
-    control_panel_html = """
+    year_options = "\n".join(
+        f'                <option value="{year}">{year}</option>' for year in years
+    )
+    toggle_label = 'Switch to Cluster View' if heatmap_mode else 'Switch to Heatmap View'
+    toggle_html = f"""        <div>
+            <button id="toggleButton" onclick="toggleViewMode()">{toggle_label}</button>
+        </div>""" if allow_toggle else ''
+    control_panel_html = f"""
     <div style="position: fixed; top: 10px; left: 50%; transform: translateX(-50%); z-index: 1000; background-color: white; padding: 10px; border-radius: 5px; box-shadow: 0px 0px 10px rgba(0,0,0,0.1);">
         <div style="margin-bottom: 10px;">
             <label for="yearSelect">Select Year:</label>
             <select id="yearSelect">
                 <option value="all">All Years</option>
-                <option value="2020">2020</option>
-                <option value="2021">2021</option>
-                <option value="2022">2022</option>
-                <option value="2023">2023</option>
-                <option value="2024">2024</option>
+{year_options}
             </select>
             <button onclick="filterByYear()">Update Year</button>
         </div>
-        <div>
-            <button id="toggleButton" onclick="toggleViewMode()">Switch to Heatmap View</button>
-        </div>
+{toggle_html}
     </div>
     """
 
     map_object.get_root().html.add_child(folium.Element(js_code + control_panel_html))
 
-def save_dashboard(map_object, analytics_html, filename="chicago_homicides_dashboard.html"):
+def stabilize_ids(element, counter=None):
+    # Replace folium's random uuid element ids with ids numbered in tree order,
+    # so the same inputs always render to the same bytes
+    counter = counter if counter is not None else itertools.count()
+    element._id = f'{next(counter):032x}'
+    for child in element._children.values():
+        stabilize_ids(child, counter)
+
+def save_dashboard(map_object, analytics_html, filename="chicago_homicides_dashboard.html",
+                   plotly_src=PLOTLY_CDN, defer_plotly=False):
+    stabilize_ids(map_object.get_root())
     map_html = map_object.get_root().render()
     
     dashboard_html = f"""
@@ -272,7 +873,7 @@ def save_dashboard(map_object, analytics_html, filename="chicago_homicides_dashb
     <html>
     <head>
         <title>Chicago Homicides Dashboard</title>
-        <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
+        <script {'defer ' if defer_plotly else ''}src="{plotly_src}"></script>
         <style>
             body {{
                 margin: 0;
@@ -317,25 +918,95 @@ def save_dashboard(map_object, analytics_html, filename="chicago_homicides_dashb
     print(f"Dashboard has been saved as {filename}")
 
 def main():
-    # Load and process data
+    parser = argparse.ArgumentParser(description="Chicago homicides dashboard")
+    parser.add_argument('--output', default="chicago_homicides_dashboard.html",
+                        help="dashboard HTML file to write")
+    parser.add_argument('--sidecar', action='store_true',
+                        help="write point data to .points.bin/.points.json files next to the "
+                             "dashboard instead of inlining it (serve the folder over HTTP)")
+    parser.add_argument('--popup-chunks', action='store_true',
+                        help="write marker popup attributes to per-year JSON files next to the "
+                             "dashboard, fetched on first click, instead of inlining them (serve over HTTP)")
+    parser.add_argument('--tiles', action='store_true',
+                        help="render incidents and community areas into a vector-tile pyramid "
+                             "next to the dashboard instead of inlining points (serve over HTTP)")
+    parser.add_argument('--heat-grid', action='store_true',
+                        help="emit heatmaps from precomputed multi-zoom grid cells instead of raw points")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="build per-year layer payloads in a pool of N processes")
+    parser.add_argument('--cache-dir', default='.build_cache',
+                        help="directory of cached year layers and charts reused across runs")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild every section from scratch")
+    parser.add_argument('--no-cube', action='store_true',
+                        help="aggregate analytics from raw rows instead of the homicides_cube rollup")
+    parser.add_argument('--offline-plotly', action='store_true',
+                        help="vendor plotly.min.js next to the dashboard, load it with defer and "
+                             "draw the charts after the map instead of using the CDN")
+    parser.add_argument('--plotly-bundle',
+                        help="Plotly build to vendor with --offline-plotly, e.g. a partial "
+                             "bar/scatter/pie bundle (default: the full bundle from the plotly package)")
+    parser.add_argument('--lazy-charts', action='store_true',
+                        help="embed chart figures as JSON and draw each one only when scrolled into view")
+    parser.add_argument('--stream', action='store_true',
+                        help="aggregate the database in chunks with bounded memory; "
+                             "the map then shows grid heatmaps only")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="rows per chunk with --stream")
+    args = parser.parse_args()
+    cache = None if args.no_cache else BuildCache(args.cache_dir)
+    # Offline builds load a vendored Plotly with defer and hydrate the charts from JSON
+    hydrate = args.offline_plotly or args.plotly_bundle is not None
+    plotly_src = PLOTLY_CDN
+    if hydrate:
+        plotly_src = vendor_plotly(os.path.dirname(os.path.abspath(args.output)), args.plotly_bundle)
+    # Hydrated and lazy charts are drawn after DOMContentLoaded, so Plotly need not block the map
+    defer_plotly = hydrate or args.lazy_charts
+    
+    if args.stream:
+        print("Streaming data...")
+        aggregates = stream_aggregates(args.chunksize)
+        print("Creating map...")
+        chicago_map = initialize_map()
+        years = create_streamed_layers(aggregates, chicago_map)
+        folium.LayerControl().add_to(chicago_map)
+        # Streamed builds have heatmaps only, so there is no cluster view to switch to
+        add_control_panel(chicago_map, years, heatmap_mode=True, allow_toggle=False)
+        print("Creating analytics...")
+        analytics_html = create_analytics_html(streamed_analytics_counts(aggregates), cache=cache,
+                                               hydrate=hydrate, lazy=args.lazy_charts)
+        print("Saving dashboard...")
+        save_dashboard(chicago_map, analytics_html, args.output, plotly_src, defer_plotly=defer_plotly)
+        print(f"Done! Open {args.output} in your web browser to view the dashboard.")
+        return
+    
+    # Load and process data; the analytics are aggregated in SQLite and need no row-level columns
     print("Loading data...")
-    data = load_data()
+    data = load_data(LAYER_COLUMNS)
     
     # Create map
     print("Creating map...")
     chicago_map = initialize_map()
-    cluster_layers, heatmap_layers = create_layers(data, chicago_map)
-    folium.LayerControl().add_to(chicago_map)
-    add_control_panel(chicago_map)
+    stem = os.path.splitext(args.output)[0]
+    if args.tiles:
+        years = create_tile_layers(data, chicago_map, stem)
+        folium.LayerControl().add_to(chicago_map)
+    elif args.sidecar:
+        years = create_sidecar_layers(data, chicago_map, stem)
+    else:
+        years = create_layers(data, chicago_map, heat_grid=args.heat_grid, cache=cache, jobs=args.jobs,
+                              popup_dir=f'{stem}.popups' if args.popup_chunks else None)
+    add_control_panel(chicago_map, years)
     
     # Create analytics
     print("Creating analytics...")
-    analytics_html = create_analytics_html(data)
+    analytics_html = create_analytics_html(sql_analytics_counts(use_cube=not args.no_cube), cache=cache,
+                                           hydrate=hydrate, lazy=args.lazy_charts)
+    if cache is not None:
+        print(f"Build cache: {cache.hits} sections reused, {cache.misses} rebuilt")
     
     # Save complete dashboard
     print("Saving dashboard...")
-    save_dashboard(chicago_map, analytics_html)
-    print("Done! Open chicago_homicides_dashboard.html in your web browser to view the dashboard.")
+    save_dashboard(chicago_map, analytics_html, args.output, plotly_src, defer_plotly=defer_plotly)
+    print(f"Done! Open {args.output} in your web browser to view the dashboard.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import sqlite3
+import pandas as pd
+import requests
+import ingest
+
+# Socrata endpoint of the "Crimes - 2001 to Present" dataset
+SOCRATA_URL = "https://data.cityofchicago.org/resource/ijzp-q8t2.json"
+
+# Socrata field name for each homicides column; Location is rebuilt from the coordinates
+SOCRATA_FIELDS = {
+    column: column.lower().replace(' ', '_')
+    for column in ingest.PORTAL_COLUMNS if column != 'Location'
+}
+
+INTEGER_COLUMNS = ['ID', 'Beat', 'Year']
+REAL_COLUMNS = ['District', 'Ward', 'Community Area', 'X Coordinate', 'Y Coordinate', 'Latitude', 'Longitude']
+
+def ensure_sync_schema(conn):
+    """Create the watermark table and the unique ID index upserts rely on"""
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (source TEXT PRIMARY KEY, updated_on TEXT)")
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_homicides_id ON homicides ("ID")')
+    conn.commit()
+
+def read_watermark(conn, source):
+    """Return the ISO high-water mark of Updated On for a source"""
+    row = conn.execute("SELECT updated_on FROM sync_state WHERE source = ?", (source,)).fetchone()
+    if row is not None:
+        return row[0]
+    # First sync: start from the newest Updated On already in the table
+    values = [value for (value,) in conn.execute('SELECT DISTINCT "Updated On" FROM homicides')]
+    if not values:
+        return None
+    return ingest.parse_portal_dates(values).max().strftime('%Y-%m-%dT%H:%M:%S')
+
+def fetch_batches(source, watermark, primary_type='HOMICIDE', batch_size=1000, app_token=None):
+    """Yield lists of Socrata records with updated_on at or after the watermark, oldest first
+
+    source is either the Socrata endpoint URL or a local JSON file of records in the
+    same shape, which stands in for the API in tests.
+    """
+    if not source.startswith(('http://', 'https://')):
+        with open(source, encoding='utf-8') as f:
+            records = json.load(f)
+        records = [
+            record for record in records
+            if (watermark is None or record['updated_on'] >= watermark)
+            and (primary_type is None or record.get('primary_type') == primary_type)
+        ]
+        records.sort(key=lambda record: (record['updated_on'], int(record['id'])))
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size]
+        return
+
+    headers = {'X-App-Token': app_token} if app_token else {}
+    # Keyset paging: each page starts after the last (updated_on, id) seen, so records
+    # updated upstream mid-sync cannot shift later rows past an $offset
+    last = None
+    while True:
+        clauses = []
+        if last is not None:
+            clauses.append(
+                f"(updated_on > '{last[0]}' OR (updated_on = '{last[0]}' AND id > {int(last[1])}))"
+            )
+        elif watermark is not None:
+            clauses.append(f"updated_on >= '{watermark}'")
+        if primary_type is not None:
+            clauses.append(f"primary_type = '{primary_type}'")
+        params = {'$order': 'updated_on, id', '$limit': batch_size}
+        if clauses:
+            params['$where'] = ' AND '.join(clauses)
+        response = requests.get(source, params=params, headers=headers, timeout=60)
+        response.raise_for_status()
+        records = response.json()
+        if not records:
+            return
+        last = records[-1]['updated_on'], records[-1]['id']
+        yield records
+
+def records_to_frame(records):
+    """Convert Socrata records to homicides rows, including the derived date columns"""
+    raw = pd.DataFrame.from_records(records)
+    frame = pd.DataFrame({
+        column: raw[field] if field in raw else None
+        for column, field in SOCRATA_FIELDS.items()
+    })
+    for column in INTEGER_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('Int64')
+    for column in REAL_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    for column in ['Arrest', 'Domestic']:
+        frame[column] = frame[column].map({True: 1, False: 0, 'true': 1, 'false': 0}).astype('Int64')
+    
+    dates = pd.to_datetime(frame['Date'], format='ISO8601')
+    frame['Date'] = dates.dt.strftime(ingest.PORTAL_DATE_FORMAT)
+    frame['Updated On'] = pd.to_datetime(frame['Updated On'], format='ISO8601').dt.strftime(ingest.PORTAL_DATE_FORMAT)
+    frame['Location'] = [
+        f'({lat}, {lon})' if pd.notna(lat) and pd.notna(lon) else None
+        for lat, lon in zip(frame['Latitude'], frame['Longitude'])
+    ]
+    frame = pd.concat([frame[ingest.PORTAL_COLUMNS], ingest.derive_date_columns(dates)], axis=1)
+    return frame.astype(object).where(frame.notna(), None)
+
+def stored_updated_on(conn, ids):
+    """Return {ID: Updated On} for the IDs already in the table"""
+    stored = {}
+    for batch in ingest.parameter_batches(ids):
+        stored.update(conn.execute(
+            f'SELECT "ID", "Updated On" FROM homicides WHERE "ID" IN ({", ".join("?" * len(batch))})', batch
+        ))
+    return stored
+
+def upsert_rows(conn, frame):
+    """Insert new rows and update rows whose Updated On changed, returning (inserted, updated, touched rowids)
+
+    Rows whose stored Updated On is unchanged, e.g. the ones refetched at the
+    watermark on every run, are skipped.
+    """
+    stored = stored_updated_on(conn, frame['ID'].tolist())
+    is_new = ~frame['ID'].isin(list(stored))
+    changed = ~is_new & (frame['ID'].map(stored) != frame['Updated On'])
+    frame = frame[is_new | changed]
+    if frame.empty:
+        return 0, 0, []
+    
+    columns = list(frame.columns)
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    updates = ', '.join(f'"{column}" = excluded."{column}"' for column in columns if column != 'ID')
+    conn.executemany(f"""
+        INSERT INTO homicides ({quoted}) VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT("ID") DO UPDATE SET {updates}
+    """, [tuple(record.values()) for record in frame.to_dict('records')])
+    rowids = []
+    for batch in ingest.parameter_batches(frame['ID'].tolist()):
+        rowids.extend(row[0] for row in conn.execute(
+            f'SELECT rowid FROM homicides WHERE "ID" IN ({", ".join("?" * len(batch))})', batch
+        ))
+    return int(is_new.sum()), int(changed.sum()), rowids
+
+def sync(db_path='homicides.db', source=SOCRATA_URL, primary_type='HOMICIDE', batch_size=1000, app_token=None):
+    """Upsert rows updated since the last sync, one transaction per batch"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ingest.migrate(conn)
+        ensure_sync_schema(conn)
+        watermark = read_watermark(conn, source)
+        print(f"Syncing rows updated on or after {watermark or 'the beginning'}...")
+        
+        inserted = updated = 0
+        for records in fetch_batches(source, watermark, primary_type, batch_size, app_token):
+            frame = records_to_frame(records)
+            with conn:
+                batch_inserted, batch_updated, rowids = upsert_rows(conn, frame)
+                ingest.refresh_rtree_rows(conn, rowids)
+                # Records arrive oldest first, so the last one carries the new high-water mark
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (source, updated_on) VALUES (?, ?)",
+                    (source, max(record['updated_on'] for record in records)[:19])
+                )
+            inserted += batch_inserted
+            updated += batch_updated
+            print(f"Upserted {inserted + updated} rows...")
+        # Appended rows fold into the rollup incrementally; rows updated in place
+        # may have moved between groups, so those force a full rebuild
+        ingest.build_cube(conn, full=updated > 0)
+    finally:
+        conn.close()
+    return inserted, updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull incidents updated since the last sync into homicides.db")
+    parser.add_argument('--db', default='homicides.db', help="SQLite database to update")
+    parser.add_argument('--source', default=SOCRATA_URL,
+                        help="Socrata endpoint URL, or a local JSON file of records in the same shape")
+    parser.add_argument('--primary-type', default='HOMICIDE', help="only sync rows of this Primary Type")
+    parser.add_argument('--all-types', action='store_true', help="sync every Primary Type")
+    parser.add_argument('--batch-size', type=int, default=1000, help="rows fetched and committed per batch")
+    parser.add_argument('--app-token', default=os.environ.get('SOCRATA_APP_TOKEN'),
+                        help="Socrata app token (defaults to $SOCRATA_APP_TOKEN)")
+    args = parser.parse_args()
+    
+    primary_type = None if args.all_types else args.primary_type
+    inserted, updated = sync(args.db, args.source, primary_type, args.batch_size, args.app_token)
+    print(f"Done! {inserted} rows inserted, {updated} rows updated in {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import sqlite3
+import pandas as pd
+import pytest
+import ingest
+
+REPO_DB = os.path.join(os.path.dirname(__file__), os.pardir, 'homicides.db')
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A scratch copy of the bundled database"""
+    path = str(tmp_path / 'homicides.db')
+    shutil.copy(REPO_DB, path)
+    return path
+
+def test_bundled_database_is_migrated():
+    conn = sqlite3.connect(f'file:{REPO_DB}?mode=ro', uri=True)
+    try:
+        assert not ingest.needs_migration(conn)
+    finally:
+        conn.close()
+
+def test_migrate_is_a_no_op_on_a_read_only_connection(db_path):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        ingest.migrate(conn)
+        assert not ingest.cube_counts(conn, 'year').empty
+    finally:
+        conn.close()
+
+def test_date_backfill_runs_in_batches(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        expected = conn.execute('SELECT date_iso, dow, hour, month FROM homicides ORDER BY rowid').fetchall()
+        conn.execute('UPDATE homicides SET date_iso = NULL, dow = NULL, hour = NULL, month = NULL')
+        conn.execute('INSERT INTO homicides ("ID", "Date") VALUES (1, NULL)')
+        conn.commit()
+
+        assert ingest.ensure_date_columns(conn, chunksize=500) == len(expected)
+        assert conn.execute(
+            'SELECT date_iso, dow, hour, month FROM homicides WHERE "ID" != 1 ORDER BY rowid'
+        ).fetchall() == expected
+        # The undated row is not picked up again
+        assert ingest.ensure_date_columns(conn, chunksize=500) == 0
+    finally:
+        conn.close()
+
+def test_ingest_csv_appends_to_an_unmigrated_database(tmp_path):
+    source = sqlite3.connect(f'file:{REPO_DB}?mode=ro', uri=True)
+    columns = ', '.join(f'"{column}"' for column in ingest.PORTAL_COLUMNS)
+    rows = pd.read_sql_query(f'SELECT {columns} FROM homicides ORDER BY rowid LIMIT 20', source)
+    source.close()
+    path = str(tmp_path / 'homicides.db')
+    conn = sqlite3.connect(path)
+    rows.iloc[:10].to_sql('homicides', conn, index=False)
+    conn.close()
+    csv_path = tmp_path / 'export.csv'
+    rows.iloc[10:].to_csv(csv_path, index=False)
+
+    assert ingest.ingest_csv(str(csv_path), path) == 10
+    conn = sqlite3.connect(path)
+    try:
+        assert not ingest.needs_migration(conn)
+        assert conn.execute('SELECT COUNT(*) FROM homicides WHERE date_iso IS NOT NULL').fetchone() == (20,)
+    finally:
+        conn.close()
+
+def test_bbox_filter_keeps_points_on_the_edge():
+    conn = sqlite3.connect(f'file:{REPO_DB}?mode=ro', uri=True)
+    try:
+        rowid, lat, lon = conn.execute(
+            'SELECT rowid, Latitude, Longitude FROM homicides WHERE Latitude IS NOT NULL LIMIT 1'
+        ).fetchone()
+        # A degenerate box around one incident, and a box whose north-east corner is that incident
+        for bbox in [(lat, lon, lat, lon), (lat - 0.01, lon - 0.01, lat, lon)]:
+            where, params = ingest.filter_clause(bbox=bbox)
+            rowids = [row[0] for row in conn.execute(f'SELECT rowid FROM homicides WHERE {where}', params)]
+            assert rowid in rowids
+        # Just outside the box
+        where, params = ingest.filter_clause(bbox=(lat + 1e-7, lon, lat + 0.01, lon + 0.01))
+        assert rowid not in [row[0] for row in conn.execute(f'SELECT rowid FROM homicides WHERE {where}', params)]
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import sqlite3
+from types import SimpleNamespace
+import pytest
+import ingest
+import sync
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'socrata_homicides.json')
+REPO_DB = os.path.join(os.path.dirname(__file__), os.pardir, 'homicides.db')
+
+@pytest.fixture
+def db_path(tmp_path):
+    """An empty homicides table, with the schema of the bundled database, in a scratch database"""
+    source = sqlite3.connect(f'file:{REPO_DB}?mode=ro', uri=True)
+    schema = source.execute("SELECT sql FROM sqlite_master WHERE name = 'homicides'").fetchone()[0]
+    source.close()
+    path = str(tmp_path / 'homicides.db')
+    conn = sqlite3.connect(path)
+    conn.execute(schema)
+    conn.close()
+    return path
+
+@pytest.fixture
+def records():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_source(tmp_path, records):
+    path = tmp_path / 'source.json'
+    path.write_text(json.dumps(records), encoding='utf-8')
+    return str(path)
+
+def query(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def test_first_sync_inserts_matching_records(db_path):
+    assert sync.sync(db_path, FIXTURE) == (4, 0)
+    assert query(db_path, 'SELECT COUNT(*) FROM homicides') == [(4,)]
+    # Only two of the records are geocoded, and the map and cube count just those
+    assert query(db_path, 'SELECT COUNT(*) FROM homicides_rtree') == [(2,)]
+    assert query(db_path, 'SELECT SUM(incidents) FROM homicides_cube') == [(2,)]
+    assert query(db_path, 'SELECT updated_on FROM sync_state') == [('2025-01-03T10:00:00',)]
+
+def test_resync_of_unchanged_records_touches_nothing(db_path, monkeypatch):
+    sync.sync(db_path, FIXTURE)
+    rebuilds = []
+    build_cube = ingest.build_cube
+    monkeypatch.setattr(ingest, 'build_cube', lambda conn, full=False: (rebuilds.append(full), build_cube(conn, full)))
+
+    # The rows at the watermark are refetched, but their Updated On has not changed
+    assert sync.sync(db_path, FIXTURE) == (0, 0)
+    assert rebuilds and not any(rebuilds)
+
+def test_changed_record_is_updated_in_place(tmp_path, db_path, records):
+    sync.sync(db_path, FIXTURE)
+    changed = dict(records[2], description='SECOND DEGREE MURDER', updated_on='2025-01-04T09:00:00.000',
+                   latitude='41.80', longitude='-87.60')
+    source = write_source(tmp_path, records[:2] + [changed] + records[3:])
+
+    assert sync.sync(db_path, source) == (0, 1)
+    assert query(db_path, 'SELECT COUNT(*) FROM homicides') == [(4,)]
+    assert query(db_path, f'SELECT Description FROM homicides WHERE ID = {changed["id"]}') == [('SECOND DEGREE MURDER',)]
+    assert query(db_path, f"""
+        SELECT min_lat FROM homicides_rtree
+        WHERE id = (SELECT rowid FROM homicides WHERE ID = {changed["id"]})
+    """) == [(pytest.approx(41.80),)]
+
+def test_resume_skips_records_older_than_the_watermark(tmp_path, db_path, records):
+    sync.sync(db_path, FIXTURE)
+    older = dict(records[1], id='99999101', case_number='ZZ000101', updated_on='2024-12-31T10:00:00.000')
+    newer = dict(records[1], id='99999102', case_number='ZZ000102', updated_on='2025-01-05T10:00:00.000')
+    source = write_source(tmp_path, records + [older, newer])
+
+    assert sync.sync(db_path, source) == (1, 0)
+    assert query(db_path, 'SELECT "Case Number" FROM homicides WHERE ID > 99999100') == [('ZZ000102',)]
+    assert query(db_path, f"SELECT updated_on FROM sync_state WHERE source = '{source}'") == [('2025-01-05T10:00:00',)]
+
+def test_batches_larger_than_the_parameter_limit(tmp_path, db_path, records):
+    many = [
+        dict(records[1], id=str(90000000 + i), case_number=f'ZZ{i:06d}')
+        for i in range(ingest.MAX_SQL_PARAMETERS + 10)
+    ]
+    source = write_source(tmp_path, many)
+
+    assert sync.sync(db_path, source, batch_size=len(many)) == (len(many), 0)
+    assert sync.sync(db_path, source, batch_size=len(many)) == (0, 0)
+
+class FakeSocrata:
+    """Answers the $where clauses fetch_batches sends, over an in-memory list of records"""
+
+    def __init__(self, records):
+        self.records = records
+        self.pages = 0
+
+    def matches(self, record, where):
+        keyset = re.search(r"updated_on > '([^']+)' OR \(updated_on = '[^']+' AND id > (\d+)\)", where)
+        if keyset:
+            last = (keyset.group(1), int(keyset.group(2)))
+            if (record['updated_on'], int(record['id'])) <= last:
+                return False
+        watermark = re.search(r"updated_on >= '([^']+)'", where)
+        if watermark and record['updated_on'] < watermark.group(1):
+            return False
+        primary_type = re.search(r"primary_type = '([^']+)'", where)
+        return not primary_type or record['primary_type'] == primary_type.group(1)
+
+    def get(self, url, params, headers, timeout):
+        assert '$offset' not in params
+        records = sorted(
+            (record for record in self.records if self.matches(record, params.get('$where', ''))),
+            key=lambda record: (record['updated_on'], int(record['id']))
+        )
+        self.pages += 1
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: [dict(record) for record in records[:params['$limit']]])
+
+def test_records_updated_upstream_mid_sync_are_not_skipped(records, monkeypatch):
+    upstream = FakeSocrata([dict(record) for record in records])
+    fetched = []
+    monkeypatch.setattr(sync.requests, 'get', upstream.get)
+
+    for batch in sync.fetch_batches('https://example.invalid/resource.json', '2025-01-01T00:00:00', batch_size=1):
+        fetched.extend(record['id'] for record in batch)
+        if upstream.pages == 1:
+            # The first record fetched is edited upstream and moves to the end of the ordering
+            upstream.records[0]['updated_on'] = '2025-01-09T10:00:00.000'
+
+    assert sorted(fetched) == sorted(['25953', '99999001', '99999002', '25953'])
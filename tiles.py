@@ -0,0 +1,190 @@
+import os
+import numpy as np
+import shapely
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.template import Template
+
+# Mapbox vector tile coordinate extent per tile side
+TILE_EXTENT = 4096
+
+# Below the deepest zoom, incidents are binned to this many cells per tile side
+# so tile size stays bounded no matter how many incidents fall in a tile
+POINT_CELLS_PER_TILE = 64
+
+def tile_coordinates(lon, lat, zoom):
+    """Project lon/lat arrays to fractional Web Mercator tile coordinates"""
+    n = 2 ** zoom
+    x = (np.asarray(lon, dtype='float64') + 180.0) / 360.0 * n
+    lat_rad = np.radians(np.asarray(lat, dtype='float64'))
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * n
+    return x, y
+
+def tile_bounds(x, y, zoom):
+    """Return the (min_lon, min_lat, max_lon, max_lat) bounds of a tile"""
+    n = 2 ** zoom
+    lons = np.array([x, x + 1]) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.array([y + 1, y]) / n))))
+    return lons[0], lats[0], lons[1], lats[1]
+
+def _point_tiles(points, zoom, max_zoom):
+    """Bin incidents per tile and cell, returning {(x, y): [feature, ...]}"""
+    x, y = tile_coordinates(points['Longitude'], points['Latitude'], zoom)
+    tx, ty = np.floor(x).astype('int64'), np.floor(y).astype('int64')
+    cells = TILE_EXTENT if zoom == max_zoom else POINT_CELLS_PER_TILE
+    qx = np.minimum(((x - tx) * cells).astype('int64'), cells - 1)
+    qy = np.minimum(((y - ty) * cells).astype('int64'), cells - 1)
+    keys = np.column_stack([tx, ty, qx, qy, points['Year'].to_numpy(dtype='int64')])
+    unique, counts = np.unique(keys, axis=0, return_counts=True)
+
+    scale = TILE_EXTENT / cells
+    features = {}
+    for (tile_x, tile_y, cell_x, cell_y, year), count in zip(unique.tolist(), counts.tolist()):
+        features.setdefault((tile_x, tile_y), []).append({
+            'geometry': shapely.Point((cell_x + 0.5) * scale, (cell_y + 0.5) * scale),
+            'properties': {'year': year, 'count': count},
+        })
+    return features
+
+def _area_tiles(areas, zoom, properties):
+    """Clip community area polygons per tile, returning {(x, y): [feature, ...]}"""
+    min_lon, min_lat, max_lon, max_lat = areas.total_bounds
+    x0, y0 = tile_coordinates(min_lon, max_lat, zoom)
+    x1, y1 = tile_coordinates(max_lon, min_lat, zoom)
+    tree = shapely.STRtree(areas.geometry.values)
+    records = areas[properties].to_dict('records')
+
+    features = {}
+    for tile_x in range(int(x0), int(x1) + 1):
+        for tile_y in range(int(y0), int(y1) + 1):
+            bounds = tile_bounds(tile_x, tile_y, zoom)
+            for index in tree.query(shapely.box(*bounds)).tolist():
+                clipped = shapely.clip_by_rect(areas.geometry.values[index], *bounds)
+                if clipped.is_empty:
+                    continue
+                local = shapely.transform(clipped, lambda coords: np.column_stack([
+                    (c - offset) * TILE_EXTENT
+                    for c, offset in zip(tile_coordinates(coords[:, 0], coords[:, 1], zoom), (tile_x, tile_y))
+                ]))
+                features.setdefault((tile_x, tile_y), []).append({
+                    'geometry': local,
+                    'properties': records[index],
+                })
+    return features
+
+def build_tile_pyramid(points, out_dir, areas=None, area_properties=('area_numbe', 'community'),
+                       min_zoom=10, max_zoom=15):
+    """Write incidents and community areas as a z/x/y directory of .pbf vector tiles"""
+    try:
+        import mapbox_vector_tile
+        from mapbox_vector_tile.encoder import on_invalid_geometry_make_valid
+    except ImportError as e:
+        raise ImportError("Vector tile output requires mapbox-vector-tile: pip install mapbox-vector-tile") from e
+
+    if areas is not None:
+        area_properties = [column for column in area_properties if column in areas.columns]
+    options = {
+        'y_coord_down': True,
+        'extents': TILE_EXTENT,
+        'on_invalid_geometry': on_invalid_geometry_make_valid,
+    }
+
+    written = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        point_features = _point_tiles(points, zoom, max_zoom)
+        area_features = _area_tiles(areas, zoom, area_properties) if areas is not None else {}
+        for tile_x, tile_y in sorted(set(point_features) | set(area_features)):
+            layers = [
+                {'name': 'incidents', 'features': point_features.get((tile_x, tile_y), [])},
+                {'name': 'community_areas', 'features': area_features.get((tile_x, tile_y), [])},
+            ]
+            tile_dir = os.path.join(out_dir, str(zoom), str(tile_x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f'{tile_y}.pbf'), 'wb') as f:
+                f.write(mapbox_vector_tile.encode(layers, default_options=options))
+            written += 1
+    return written
+
+def incident_style(radius=3, color='#de2d26', opacity=0.7, show_areas=True):
+    """Return one VectorTileLayer mode style"""
+    return {
+        'radius': radius,
+        'color': color,
+        'opacity': opacity,
+        'areas': (
+            {'weight': 1, 'color': 'black', 'fill': False} if show_areas
+            else {'weight': 0, 'fill': False, 'opacity': 0}
+        ),
+    }
+
+class VectorTileLayer(JSCSSMixin, Layer):
+    """Leaflet.VectorGrid layer over a tile pyramid written by build_tile_pyramid
+
+    styles maps a mode name to incident and community-area styles. The layer
+    exposes setFilter(year, mode), which restyles the same tiles for another year
+    (null for all years) or mode, so one layer serves every year.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            var styles = {{ this.styles|tojavascript }};
+            var layer = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+                rendererFactory: L.canvas.tile,
+                interactive: true,
+                minNativeZoom: {{ this.min_zoom }},
+                maxNativeZoom: {{ this.max_zoom }},
+                year: {{ this.year|tojson }},
+                mode: {{ this.mode|tojson }},
+                vectorTileLayerStyles: {
+                    incidents: function (properties, zoom) {
+                        var options = layer.options;
+                        if (options.year !== null && properties.year !== options.year) {
+                            return [];
+                        }
+                        var style = styles[options.mode];
+                        var radius = style.radius * (1 + Math.log2(properties.count));
+                        return {radius: radius, fill: true, fillColor: style.color,
+                                fillOpacity: style.opacity, stroke: false};
+                    },
+                    community_areas: function (properties, zoom) {
+                        return styles[layer.options.mode].areas;
+                    }
+                }
+            }).on('click', function (e) {
+                var properties = e.layer.properties;
+                var text = properties.community !== undefined
+                    ? properties.community
+                    : properties.count + ' incident(s) in ' + properties.year;
+                L.popup().setLatLng(e.latlng).setContent(text).openOn({{ this._parent.get_name() }});
+            });
+            layer.setFilter = function (year, mode) {
+                if (year !== this.options.year || mode !== this.options.mode) {
+                    this.options.year = year;
+                    this.options.mode = mode;
+                    if (this._map) {
+                        this.redraw();
+                    }
+                }
+                return this;
+            };
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = [
+        ('leaflet-vectorgrid', 'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js'),
+    ]
+
+    def __init__(self, url, name=None, year=None, min_zoom=10, max_zoom=15, radius=3,
+                 color='#de2d26', opacity=0.7, show_areas=True, show=True, styles=None):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'VectorTileLayer'
+        self.url = url
+        self.year = year
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.styles = styles or {
+            'default': incident_style(radius=radius, color=color, opacity=opacity, show_areas=show_areas)
+        }
+        self.mode = next(iter(self.styles))